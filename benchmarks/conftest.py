@@ -0,0 +1,138 @@
+# Fixtures for the offline benchmarks (pytest-benchmark)
+#
+# Nothing here touches the network: pages come from benchmarks/fixtures, either
+# directly or through a local stand-in server (see stand_in_server), and S3 is
+# replaced by moto's in-memory S3. The fixtures are synthetic pages with the
+# Beachmapp markup that the scraper reads; record_fixtures.py replaces them with
+# copies of the live pages.
+#
+# Usage: pytest benchmarks --benchmark-only   (or: just bench)
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_PATH = Path(__file__).parent.parent
+sys.path.insert(0, str(REPO_PATH / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+# settings.toml is found from the repo root whatever the working directory, and the S3
+# secret only needs to exist (the client is replaced by moto's)
+os.environ.setdefault("ROOT_PATH_FOR_DYNACONF", str(REPO_PATH))
+os.environ.setdefault("SCALEWAY_SECRET_ACCESS_KEY", "benchmark")
+
+from stand_in_server import FIXTURES_PATH, StandInSite, load_fixtures
+
+N_BEACHES = 160   # Beaches in the daily data used by the writer benchmarks (as in a full run)
+STAND_IN_RATE_PER_SECOND = 1000   # The stand-in needs no politeness limit, so the benchmarks measure the job itself
+
+
+@pytest.fixture(scope="session")
+def pages():
+    """
+    The fixture pages, by name: root, region, beach and beach_no_alerts
+    """
+    return load_fixtures(FIXTURES_PATH)
+
+
+def unthrottled(site):
+    """
+    Register a HostThrottle for the site that allows a much higher request rate than Beachmapp's
+    """
+    import beach_throttle
+
+    host = site.base_url.split("/")[2]
+    beach_throttle._throttles[host] = beach_throttle.HostThrottle(
+        host, rate=STAND_IN_RATE_PER_SECOND, burst=STAND_IN_RATE_PER_SECOND,
+        concurrency=beach_throttle.MAX_CONCURRENCY)
+    return site
+
+
+@pytest.fixture(scope="session")
+def stand_in_site():
+    with StandInSite() as site:
+        yield unthrottled(site)
+
+
+@pytest.fixture(scope="session")
+def flaky_stand_in_site():
+    """
+    A stand-in with some latency and 2% of requests failing with a 503
+    """
+    with StandInSite(latency_seconds=0.01, latency_jitter_seconds=0.02, error_rate=0.02, seed=1) as site:
+        yield unthrottled(site)
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    """
+    Run in an empty directory (with an empty data/), so the relative data/ paths
+    (SQLite, journal, caches, output files) start empty and are removed afterwards
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """
+    An in-memory (moto) S3 client with the beach bucket, used by scaleway_s3_storage
+    """
+    from moto import mock_aws
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "benchmark")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "benchmark")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        import boto3
+        import scaleway_s3_storage
+        from beach_writers import BUCKET_NAME
+
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET_NAME)
+        monkeypatch.setitem(scaleway_s3_storage._s3_clients, os.getpid(), client)
+        yield client
+
+
+@pytest.fixture
+def no_skipping(monkeypatch):
+    """
+    Fetch and parse every page on every round: no HTTP cache, no skipping unchanged beaches
+    """
+    import beach_swim_daily_job
+
+    monkeypatch.setattr(beach_swim_daily_job, "USE_HTTP_CACHE", False)
+    monkeypatch.setattr(beach_swim_daily_job, "SKIP_UNCHANGED", False)
+
+
+@pytest.fixture
+def beaches_url_list(pages):
+    """
+    [region, beach URL] for N_BEACHES beaches, as from create_all_beaches_list
+    """
+    from beach_swim_daily_job import BEACHMAPP_BASE_URL, create_beach_list
+
+    regions = [url.split("/")[-1] for url in
+               create_beach_list.fn(BEACHMAPP_BASE_URL, pages["root"], "beachmapp/Beaches", False)]
+    beach_urls = create_beach_list.fn(BEACHMAPP_BASE_URL, pages["region"], "/beachmapp/Beach", False)
+    return [[region, f"{beach_url}-{region}"] for region in regions for beach_url in beach_urls][:N_BEACHES]
+
+
+@pytest.fixture
+def daily_data_df(pages, beaches_url_list, no_skipping, work_dir):
+    """
+    Normalised daily data for N_BEACHES beaches, parsed from the fixture beach pages
+    (in work_dir, as scraping archives the pages under data/)
+    """
+    from beach_normalise import normalise_daily_beach_data
+    from beach_swim_daily_job import (BEACHWATCH_FIELDS, append_daily_data_row, daily_data_columns_to_df,
+                                      new_daily_data_columns, scrape_beach_row)
+
+    columns = new_daily_data_columns(BEACHWATCH_FIELDS)
+    for i, (region, beach_url) in enumerate(beaches_url_list):
+        html = pages["beach_no_alerts" if i % 4 == 0 else "beach"]
+        append_daily_data_row(columns, scrape_beach_row(region, beach_url, html, BEACHWATCH_FIELDS))
+    return normalise_daily_beach_data(daily_data_columns_to_df(columns), BEACHWATCH_FIELDS)
@@ -0,0 +1,78 @@
+# Benchmark: parse time per beach page
+#
+# Compares the original per-field find() scans (get_all_data_for_beach) with the
+# single-pass extractor (beach_extract) for each backend, and checks the output is identical,
+# both for the pages and for EDGE_CASE_PAGES (where the backends' trees or serialisation differ).
+#
+# Usage: python benchmarks/extract_benchmark.py [page.html | beach URL ...]
+#        (with no arguments the first few beach pages on Beachmapp are used)
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import httpx
+from bs4 import BeautifulSoup
+
+from beach_extract import extract_beach_data
+from beach_swim_daily_job import BEACHMAPP_BASE_URL, BEACHWATCH_FIELDS, create_beach_list, get_all_data_for_beach
+
+N_PAGES = 3
+N_REPEATS = 20
+BACKENDS = ["html.parser", "lxml"]
+
+# Fields whose first child is whitespace only, a comment or a void element
+EDGE_CASE_PAGES = {
+    "whitespace": '<div class="navbar-title-text">\n  <span>Bondi</span></div>'
+                  '<span class="bw-swell">  </span>',
+    "comment": '<span class="bw-air-temp-value"><!-- comment -->19°</span>',
+    "void element": '<div class="bw-alert-text"><br>Shark sighted</div><div class="bw-wind"><img src="w.png"></div>',
+    "preformatted": '<pre><div class="bw-weather-text">\n  </div></pre>',
+}
+
+
+def load_pages(args):
+    if args:
+        return [httpx.get(arg).text if arg.startswith("http") else Path(arg).read_text() for arg in args]
+    base_html = httpx.get(BEACHMAPP_BASE_URL).text
+    region_url = create_beach_list.fn(BEACHMAPP_BASE_URL, base_html, "beachmapp/Beaches", False)[0]
+    region_html = httpx.get(region_url).text
+    beach_urls = create_beach_list.fn(BEACHMAPP_BASE_URL, region_html, "/beachmapp/Beach", False)
+    return [httpx.get(url).text for url in beach_urls[:N_PAGES]]
+
+
+def as_strings(beach_data):
+    return [([str(x) for x in value] if isinstance(value, list) else str(value), name)
+            for value, name in beach_data]
+
+
+def legacy_extract(html):
+    return get_all_data_for_beach(BeautifulSoup(html, "html.parser"), BEACHWATCH_FIELDS)
+
+
+def is_identical(html, backend):
+    return extract_beach_data(html, BEACHWATCH_FIELDS, backend) == as_strings(legacy_extract(html))
+
+
+def main(args):
+    pages = load_pages(args)
+    legacy_seconds = timeit.timeit(lambda: [legacy_extract(html) for html in pages], number=N_REPEATS)
+    legacy_ms = 1000 * legacy_seconds / (N_REPEATS * len(pages))
+    print(f"{'find() per field':>20}: {legacy_ms:7.2f} ms/page")
+
+    for backend in BACKENDS:
+        try:
+            identical = all(is_identical(html, backend) for html in pages + list(EDGE_CASE_PAGES.values()))
+        except ImportError as e:
+            print(f"{backend:>20}: skipped ({e})")
+            continue
+        seconds = timeit.timeit(
+            lambda: [extract_beach_data(html, BEACHWATCH_FIELDS, backend) for html in pages], number=N_REPEATS)
+        ms = 1000 * seconds / (N_REPEATS * len(pages))
+        print(f"{backend:>20}: {ms:7.2f} ms/page ({legacy_ms / ms:.1f}x faster, identical output: {identical})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
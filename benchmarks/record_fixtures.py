@@ -0,0 +1,48 @@
+# Record fresh copies of the Beachmapp pages used by the benchmarks (benchmarks/fixtures)
+#
+# Saves the root page, the first region page and two beach pages from that region:
+# one with alerts (beach.html) and one without (beach_no_alerts.html), if there is one.
+#
+# Usage: python benchmarks/record_fixtures.py [base URL]
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import httpx
+
+from beach_extract import extract_beach_data
+from beach_swim_daily_job import BEACHMAPP_BASE_URL, create_beach_list
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+MAX_BEACHES = 20   # Beach pages to look through for one with and one without alerts
+
+
+def has_alerts(html):
+    return bool(extract_beach_data(html, {"bw-alert-text": "Alert"})[0][0])
+
+
+def main(base_url=BEACHMAPP_BASE_URL):
+    FIXTURES_PATH.mkdir(exist_ok=True)
+    with httpx.Client(timeout=30, follow_redirects=True) as client:
+        root_html = client.get(base_url).text
+        region_url = create_beach_list.fn(base_url, root_html, "beachmapp/Beaches", False)[0]
+        region_html = client.get(region_url).text
+        pages = {"root": root_html, "region": region_html}
+        for beach_url in create_beach_list.fn(base_url, region_html, "/beachmapp/Beach", False)[:MAX_BEACHES]:
+            beach_html = client.get(beach_url).text
+            name = "beach" if has_alerts(beach_html) else "beach_no_alerts"
+            pages.setdefault(name, beach_html)
+            if "beach" in pages and "beach_no_alerts" in pages:
+                break
+        pages.setdefault("beach", pages.get("beach_no_alerts"))
+
+    for name, html in pages.items():
+        if html is not None:
+            (FIXTURES_PATH / f"{name}.html").write_text(html)
+            print(f"{name + '.html':>22}: {len(html):>7} characters")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,168 @@
+# Local stand-in for the Beachmapp site, serving the (synthetic) pages in benchmarks/fixtures
+#
+#   /beachmapp                    - root.html (the region links)
+#   /beachmapp/Beaches/<region>   - region.html, with the beach links put under the region
+#                                   (/beachmapp/Beach/<region>/<beach>) so every beach URL is distinct
+#   /beachmapp/Beach/...          - beach.html, or beach_no_alerts.html for every fourth beach
+#
+# Each response can be delayed (latency_seconds, plus up to latency_jitter_seconds) and a
+# fraction of requests (error_rate) answered with error_status and a Retry-After header,
+# to see how the fetcher's retries and throttling behave. Responses have an ETag, so
+# conditional GETs get a 304 as from the real site.
+#
+# Usage: python benchmarks/stand_in_server.py [--port 8765] [--latency 0.05] [--error-rate 0.02]
+#        then point BEACHMAPP_BASE_URL at http://127.0.0.1:8765/beachmapp
+
+import argparse
+import hashlib
+import http.server
+import random
+import threading
+import time
+from pathlib import Path
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+DEFAULT_PORT = 8765
+BEACH_PATH = "/beachmapp/Beach/"
+
+
+def load_fixtures(path=FIXTURES_PATH):
+    return {page.stem: page.read_text() for page in Path(path).glob("*.html")}
+
+
+class StandInSite:
+    def __init__(self, port=0, latency_seconds=0.0, latency_jitter_seconds=0.0, error_rate=0.0,
+                 error_status=503, retry_after=0, seed=None, fixtures_path=FIXTURES_PATH):
+        self.pages = load_fixtures(fixtures_path)
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/beachmapp"
+
+    def page(self, path):
+        """
+        The html for a path on the site, or None if there is no such page
+        """
+        path = path.rstrip("/")
+        if path == "/beachmapp":
+            return self.pages["root"]
+        if path.startswith("/beachmapp/Beaches/"):
+            region = path.rsplit("/", 1)[-1]
+            return self.pages["region"].replace(f'href="{BEACH_PATH}', f'href="{BEACH_PATH}{region}/')
+        if path.startswith(BEACH_PATH):
+            variant = int(hashlib.md5(path.encode()).hexdigest(), 16) % 4
+            return self.pages["beach_no_alerts" if variant == 0 else "beach"]
+        return None
+
+    def _next_response(self):
+        """
+        Count a request and return (delay in seconds, True if it should fail)
+        """
+        with self.lock:
+            self.requests += 1
+            delay = self.latency_seconds + self.random.uniform(0, self.latency_jitter_seconds)
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _handler(self):
+        site = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                delay, fail = site._next_response()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    self.send_response(site.error_status)
+                    self.send_header("Retry-After", str(site.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                html = site.page(self.path)
+                if html is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = html.encode()
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the fixture Beachmapp pages locally")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many more seconds of delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After (seconds) sent with errors")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    site = StandInSite(args.port, args.latency, args.jitter, args.error_rate, args.error_status,
+                       args.retry_after, args.seed)
+    print(f"Serving {FIXTURES_PATH} at {site.base_url} (Ctrl-C to stop)")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+        print(f"{site.requests} requests, {site.errors} errors injected")
+
+
+if __name__ == "__main__":
+    main()
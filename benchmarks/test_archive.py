@@ -0,0 +1,32 @@
+# Tests: the archive of beach pages (see beach_archive)
+
+import pendulum
+
+from beach_archive import archive_page, archived_days, evict_archive, read_blob, read_manifest
+from beach_normalise import LOCAL_TIMEZONE
+
+ROOT = "data/html_archive"
+
+
+def archive_days_ago(days_ago, html, beach="Bondi-Beach"):
+    retrieved = pendulum.now(LOCAL_TIMEZONE).subtract(days=days_ago).isoformat()
+    return archive_page(retrieved, "Sydney", f"https://example.com/Beach/{beach}", html, ROOT)
+
+
+def test_evict_archive(work_dir):
+    shared = archive_days_ago(10, "<html>unchanged</html>", "Bronte-Beach")
+    old = archive_days_ago(10, "<html>10 days ago</html>")
+    archive_days_ago(2, "<html>unchanged</html>", "Bronte-Beach")
+    archive_days_ago(2, "<html>2 days ago</html>")
+    today = archive_days_ago(0, "<html>today</html>")
+    assert len(archived_days(root=ROOT)) == 3
+
+    assert len(evict_archive(ROOT, keep_days=5)) == 1
+    days = archived_days(root=ROOT)
+    assert len(days) == 2
+    assert read_blob(shared, ROOT) == "<html>unchanged</html>"   # Still used by a day kept
+    assert not list(work_dir.glob(f"{ROOT}/blobs/*/{old}.*"))
+
+    assert evict_archive(ROOT, max_bytes=1) == days[:1]   # The latest day is always kept
+    assert [entry["sha256"] for entry in read_manifest(days[1], ROOT).values()] == [today]
+    assert [path.name.split(".")[0] for path in work_dir.glob(f"{ROOT}/blobs/*/*")] == [today]
@@ -0,0 +1,68 @@
+# Benchmarks: the discovery and scrape flows against the local stand-in server
+#
+# Every page is fetched and parsed on each round (no HTTP cache or skipping of
+# unchanged beaches), with the stand-in's request rate limit lifted (see conftest).
+
+import asyncio
+
+import httpx
+import pytest
+
+from beach_async_job import create_all_beaches_list_async, get_daily_beach_data_async
+from beach_fetch import retrieve_urls
+from beach_swim_daily_job import BEACHWATCH_FIELDS, create_all_beaches_list, get_daily_beach_data
+
+ROUNDS = 3
+
+
+@pytest.fixture
+def stand_in_beaches(stand_in_site, work_dir, no_skipping):
+    return create_all_beaches_list(stand_in_site.base_url, False, "always")
+
+
+def test_create_all_beaches_list(benchmark, stand_in_site, work_dir, no_skipping):
+    beaches = benchmark.pedantic(create_all_beaches_list, args=(stand_in_site.base_url, False, "always"),
+                                 rounds=ROUNDS)
+    assert len({beach_url for _, beach_url in beaches}) == len(beaches) > 0
+
+
+def test_get_daily_beach_data(benchmark, stand_in_site, stand_in_beaches):
+    stand_in_site.reset_counts()
+    all_daily_data_df = benchmark.pedantic(get_daily_beach_data, args=(BEACHWATCH_FIELDS, stand_in_beaches),
+                                           rounds=ROUNDS)
+    assert len(all_daily_data_df) == len(stand_in_beaches)
+    assert stand_in_site.requests >= len(stand_in_beaches)
+
+
+def test_get_daily_beach_data_with_errors(benchmark, stand_in_site, flaky_stand_in_site, stand_in_beaches):
+    # The same beaches, from the stand-in with latency and errors. The retries of the
+    # failed requests (after the jittered retry delay) are included in the time
+    beaches = [[region, beach_url.replace(stand_in_site.base_url, flaky_stand_in_site.base_url)]
+               for region, beach_url in stand_in_beaches]
+    flaky_stand_in_site.reset_counts()
+    all_daily_data_df = benchmark.pedantic(get_daily_beach_data, args=(BEACHWATCH_FIELDS, beaches), rounds=ROUNDS)
+    assert len(all_daily_data_df) == len(beaches)
+    assert flaky_stand_in_site.errors > 0
+
+
+def test_not_found_is_not_retried(stand_in_site):
+    # Only 408, 429 and 5xx responses (and connection errors) are retried: a 404 fails at once
+    stand_in_site.reset_counts()
+    with pytest.raises(httpx.HTTPStatusError):
+        retrieve_urls([f"{stand_in_site.base_url}/no-such-page"])
+    assert stand_in_site.requests == 1
+
+
+def test_create_all_beaches_list_async(benchmark, stand_in_site, stand_in_beaches):
+    beaches = benchmark.pedantic(
+        lambda: asyncio.run(create_all_beaches_list_async(stand_in_site.base_url, False, "always")), rounds=ROUNDS)
+    assert beaches == stand_in_beaches
+
+
+def test_get_daily_beach_data_async(benchmark, stand_in_site, stand_in_beaches):
+    stand_in_site.reset_counts()
+    all_daily_data_df = benchmark.pedantic(
+        lambda: asyncio.run(get_daily_beach_data_async(BEACHWATCH_FIELDS, stand_in_beaches)), rounds=ROUNDS)
+    assert all_daily_data_df.equals(get_daily_beach_data(BEACHWATCH_FIELDS, stand_in_beaches)
+                                    .assign(Retrieved=all_daily_data_df["Retrieved"]))
+    assert stand_in_site.requests >= len(stand_in_beaches)
@@ -0,0 +1,75 @@
+# Benchmarks: parsing the fixture pages (no network)
+
+import pytest
+from bs4 import BeautifulSoup
+
+from beach_extract import ExtractionPlan, extract_beach_data, extraction_plan
+from extract_benchmark import EDGE_CASE_PAGES, is_identical
+from beach_parse_pool import PARSE_WORKERS, ParsePool
+from beach_swim_daily_job import (BEACHMAPP_BASE_URL, BEACHWATCH_FIELDS, BEACHWATCH_PLAN, create_beach_list,
+                                  get_all_data_for_beach, scrape_beach_daily_data)
+from site_spec import BEACHMAPP_SPEC
+
+N_PAGES = 160   # Pages parsed by the parse pool benchmarks (a full run)
+
+
+@pytest.mark.parametrize("page", ["beach", "beach_no_alerts"])
+def test_scrape_beach_daily_data(benchmark, pages, page):
+    beach_data = benchmark(scrape_beach_daily_data, pages[page], BEACHWATCH_FIELDS)
+    assert [name for _, name in beach_data] == list(BEACHWATCH_FIELDS.values())
+
+
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+def test_extract_beach_data_backend(benchmark, pages, backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    beach_data = benchmark(extract_beach_data, pages["beach"], BEACHWATCH_FIELDS, backend)
+    assert beach_data == extract_beach_data(pages["beach"], BEACHWATCH_FIELDS)
+
+
+@pytest.mark.parametrize("backend", ["html.parser", "lxml"])
+@pytest.mark.parametrize("case", list(EDGE_CASE_PAGES))
+def test_extract_beach_data_edge_cases(backend, case):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    assert is_identical(EDGE_CASE_PAGES[case], backend)
+
+
+@pytest.mark.parametrize("page", ["beach", "beach_no_alerts"])
+def test_extraction_plan(benchmark, pages, page):
+    beach_data = benchmark(BEACHWATCH_PLAN.extract, pages[page])
+    legacy_data = get_all_data_for_beach(BeautifulSoup(pages[page], "html.parser"), BEACHWATCH_FIELDS)
+    as_strings = [([str(v) for v in value] if isinstance(value, list) else str(value), name) for value, name in legacy_data]
+    assert beach_data == as_strings
+
+
+def test_extraction_plan_fields():
+    assert BEACHWATCH_PLAN == ExtractionPlan(BEACHMAPP_SPEC.fields) == extraction_plan(BEACHWATCH_FIELDS)
+    assert [field["name"] for field in BEACHWATCH_PLAN.describe()] == list(BEACHWATCH_FIELDS.values())
+    assert [field.name for field in BEACHWATCH_PLAN.fields if field.multi] == ["Alert"]
+    missing = ExtractionPlan({"no-such-class": "Missing", "bw-alert-text": "Alert"}).extract("<div></div>")
+    assert missing == [("no-such-class", "Missing"), ([], "Alert")]
+
+
+def test_create_beach_list_regions(benchmark, pages):
+    region_urls = benchmark(create_beach_list.fn, BEACHMAPP_BASE_URL, pages["root"], "beachmapp/Beaches", False)
+    assert region_urls and all("/beachmapp/Beaches/" in url for url in region_urls)
+
+
+def test_create_beach_list_beaches(benchmark, pages):
+    beach_urls = benchmark(create_beach_list.fn, BEACHMAPP_BASE_URL, pages["region"], "/beachmapp/Beach", False)
+    assert beach_urls and all("/beachmapp/Beach/" in url for url in beach_urls)
+
+
+@pytest.mark.parametrize("max_workers", sorted({1, PARSE_WORKERS}))
+def test_parse_pool(benchmark, pages, max_workers):
+    beach_pages = [pages["beach_no_alerts" if i % 4 == 0 else "beach"] for i in range(N_PAGES)]
+
+    def parse_all():
+        with ParsePool(BEACHWATCH_FIELDS, max_workers) as pool:
+            for i, html in enumerate(beach_pages):
+                pool.submit(i, html)
+            return dict(pool.results())
+
+    results = benchmark.pedantic(parse_all, rounds=3)
+    assert len(results) == N_PAGES
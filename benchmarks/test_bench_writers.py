@@ -0,0 +1,40 @@
+# Benchmarks: each output writer (see beach_writers) and the S3 transfers,
+# with S3 replaced by moto's in-memory S3 (see conftest)
+
+import pytest
+
+from beach_writers import BUCKET_NAME, WRITERS, SINK_DEPENDENCIES, run_writer
+from scaleway_s3_storage import dataframe_to_s3, upload_files_to_s3
+
+ROUNDS = 5
+
+
+@pytest.mark.parametrize("sink", list(WRITERS))
+def test_writer(benchmark, sink, daily_data_df, work_dir, s3):
+    if sink == "xlsx":
+        pytest.importorskip("openpyxl")
+    for dependency in SINK_DEPENDENCIES.get(sink, []):
+        run_writer(dependency, daily_data_df)
+    written = benchmark.pedantic(run_writer, args=(sink, daily_data_df), rounds=ROUNDS)
+    assert written
+
+
+@pytest.mark.parametrize("file_format", ["csv", "csv.gz", "parquet"])
+def test_dataframe_to_s3(benchmark, file_format, daily_data_df, s3):
+    filename = f"benchmark.{file_format}"
+    assert benchmark(dataframe_to_s3, s3, daily_data_df, BUCKET_NAME, filename, file_format)
+    assert s3.head_object(Bucket=BUCKET_NAME, Key=filename)["ContentLength"] > 0
+
+
+def test_dataframe_to_s3_unsupported_format(daily_data_df, s3):
+    with pytest.raises(ValueError, match="supported: csv.gz, parquet, csv"):
+        dataframe_to_s3(s3, daily_data_df, BUCKET_NAME, "benchmark.json")
+
+
+def test_upload_files_to_s3(benchmark, daily_data_df, work_dir, s3):
+    file_names = []
+    for i in range(16):
+        file_name = work_dir / f"part-{i}.parquet"
+        daily_data_df.to_parquet(file_name)
+        file_names.append(str(file_name))
+    assert all(benchmark(upload_files_to_s3, s3, file_names, BUCKET_NAME))
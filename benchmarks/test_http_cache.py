@@ -0,0 +1,16 @@
+# Tests: the on-disk HTTP cache (see http_cache)
+
+from concurrent.futures import ThreadPoolExecutor
+
+from http_cache import HttpCache
+
+
+def test_write_same_key_from_threads(work_dir):
+    cache = HttpCache(work_dir / "http_cache")
+    meta_path, body_path = cache._paths("https://example.com/beach")
+    writes = [(meta_path, '{"n": %d}' % i) if i % 2 else (body_path, "<html>%d</html>" % i) for i in range(200)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda write: cache._write(*write), writes))
+    assert meta_path.read_text().startswith('{"n": ')
+    assert body_path.read_text().startswith("<html>")
+    assert sorted(path.name for path in cache.cache_dir.iterdir()) == sorted([meta_path.name, body_path.name])
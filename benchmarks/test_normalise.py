@@ -0,0 +1,22 @@
+# Tests: normalising the scraped daily data (see beach_normalise)
+
+import pandas as pd
+
+from beach_normalise import normalise_daily_beach_data
+from beach_swim_daily_job import BEACHWATCH_FIELDS, daily_data_columns_to_df, new_daily_data_columns
+
+
+def test_normalise_placeholders_and_blanks():
+    columns = new_daily_data_columns(BEACHWATCH_FIELDS)
+    for values in columns.values():
+        values.append("x")
+    columns["Retrieved"][0] = "2026-10-18T08:00:00+11:00"
+    columns["Beach name"][0] = "   "                      # Blank
+    columns["Water temperature"][0] = "bw-ocean-temp-value"  # Placeholder: the field was missing
+    columns["Alert"][0] = list("bw-alert-text")             # Joined character by character
+    df = normalise_daily_beach_data(daily_data_columns_to_df(columns), BEACHWATCH_FIELDS)
+    assert df["Beach name"].isna().all()
+    assert df["Water temperature"].isna().all()
+    assert df["Alert"].isna().all()
+    assert df["Swell"].tolist() == ["x"]
+    assert df["Retrieved"].iloc[0] == pd.Timestamp("2026-10-17T21:00:00Z")
@@ -0,0 +1,40 @@
+# Tests: the SQLite beach database (see beach_sqlite)
+
+import pandas as pd
+from sqlite_utils import Database
+
+from beach_sqlite import (BEACH_TABLE, LEGACY_TABLE, MIGRATED_LEGACY_TABLE, SQLITE_DB_PATH, latest_beach_rows,
+                          legacy_beach_url, open_beach_db)
+from site_spec import BEACHWATCH_FIELDS
+
+
+def legacy_row(retrieved, beach_name, water_temperature):
+    values = {name: classname for classname, name in BEACHWATCH_FIELDS.items()}   # Missing fields
+    values.update({"Beach name": beach_name, "Water temperature": water_temperature,
+                   "Data last updated": "Data last updated 10 minutes ago", "Alert": ""})
+    return {"Retrieved": retrieved, "Region": "Sydney", **values}
+
+
+def test_migrate_legacy_table(work_dir):
+    # As the job wrote it before the beach table: every run appended, without the beach URL
+    legacy_df = pd.DataFrame([
+        legacy_row("2026-10-17T08:00:00+11:00", "Bondi Beach", "18°"),
+        legacy_row("2026-10-17T09:00:00+11:00", "Bondi Beach", "19°"),   # Same day, later
+        legacy_row("2026-10-18T08:00:00+11:00", "Bondi Beach", "20°"),
+        legacy_row("2026-10-18T08:00:00+11:00", "Clovelly Beach", "17°"),
+        legacy_row("2026-10-18T08:00:00+11:00", "navbar-title-text", "bw-ocean-temp-value"),   # No page data
+    ])
+    legacy_df.to_sql(LEGACY_TABLE, con=Database(SQLITE_DB_PATH).conn, if_exists="append")
+
+    db = open_beach_db(SQLITE_DB_PATH)
+    assert not db[LEGACY_TABLE].exists()
+    assert db[MIGRATED_LEGACY_TABLE].count == len(legacy_df)
+    rows = {(url, day): temperature for url, day, temperature in db.execute(
+        f'SELECT "Beach URL", "Data date", "Water temperature" FROM "{BEACH_TABLE}"')}
+    bondi, clovelly = legacy_beach_url("Bondi Beach"), legacy_beach_url("Clovelly Beach")
+    assert bondi.endswith("/beachmapp/Beach/Bondi-Beach")
+    assert rows == {(bondi, "2026-10-17"): 19.0, (bondi, "2026-10-18"): 20.0, (clovelly, "2026-10-18"): 17.0}
+    assert latest_beach_rows(db, [bondi])["Water temperature"].tolist() == [20.0]
+
+    open_beach_db(SQLITE_DB_PATH)   # Only migrated once
+    assert db[BEACH_TABLE].count == 3
@@ -9,7 +9,6 @@ import pandas as pd
 import pendulum
 import requests
 import httpx
-from bs4 import BeautifulSoup
 from prefect import Flow, task
 # from prefect.executors import LocalDaskExecutor
 # from prefect.schedules import Schedule
@@ -21,25 +20,10 @@ from prefect.context import get_run_context
 from prefect_slack import SlackCredentials
 from prefect_slack.messages import send_chat_message
 
+from src.beach_catalogue import catalogue_is_current, links_hash, load_catalogue, save_catalogue
+from src.beach_extract import extract_beach_data, page_links
 from src.scaleway_s3_storage import connect_to_s3, dataframe_to_csv_s3
-
-BEACHMAPP_BASE_URL = "https://www.environment.nsw.gov.au/beachmapp"
-
-BEACHWATCH_FIELDS = {
-    "navbar-title-text": "Beach name",
-    "beach-timelapse-panel": "Data last updated",
-    "bw-status-text": "Pollution status",
-    "bw-air-temp-value": "Maximum forecast air temperature",
-    "bw-ocean-temp-value": "Water temperature",
-    "bw-weather-text": "Weather forecast",
-    "bw-swell": "Swell",
-    "bw-wind": "Wind",
-    "bw-patrol-info": "Patrol info",
-    "bw-rainfall": "Rainfall",
-    "bw-high-tide": "High tide",
-    "bw-low-tide": "Low tide",
-    "bw-alert-text": "Alert"
-}
+from src.site_spec import BEACHMAPP_BASE_URL, BEACHMAPP_SPEC, BEACHWATCH_FIELDS
 
 
 def retrieve_url(url):
@@ -61,80 +45,42 @@ def retrieve_url_requests(url):
         raise ValueError(f"{url} could not be retrieved.")
 
 
-# Define various helper functions to parse the html pages to extract the data for each beach
-
-
-def get_beachwatch_data_for_class(beach_soup, classname, item_name):
-    """
-    Given the parsed html from BeautifulSoup for a particular page, 
-    search for a specific class name within either a 'div' or 'span' block.
-    item_name is the user-friendly name that we have chosen for each class name
-    """
-    if classname == "bw-alert-text":
-        item = beach_soup.find_all("div", {"class": classname})
-        return ([x.contents[0] for x in item], item_name)
-    else:
-        item = beach_soup.find("div", {"class": classname})
-        if item is None:
-            item = beach_soup.find("span", {"class": classname})
-    return (item.contents[0], item_name)
-
-
-def get_all_data_for_beach(beach_soup, beachwatch_fields):
-    beach_data = []
-    for classname in beachwatch_fields:
-        try:
-            item, item_name = get_beachwatch_data_for_class(
-                beach_soup, classname, beachwatch_fields[classname])
-        except Exception:
-            item = classname
-            item_name = beachwatch_fields[classname]
-        beach_data.append((item, item_name))
-    return beach_data
-
-
-def scrape_beach_daily_data(beachmapp_html, beachwatch_fields):
-    """
-    Given a string of html representing a Beachmapp page,
-    returns the daily data for that beach
-    """
-
-    beach_soup = BeautifulSoup(beachmapp_html, "html.parser")
-
-    return get_all_data_for_beach(beach_soup, beachwatch_fields)
+# The page parsing is shared with src/beach_swim_daily_job.py (see src/beach_extract.py),
+# and the links and fields come from the Beachmapp site spec (see src/site_spec.py)
 
 
 def create_beach_list(base_url, main_html, url_path, bypass):
     """
     Given the main page html, creates a list of the beach URLs from 
-    this page which will be subsequently passed to scrape_beach_daily_data
+    this page which will be subsequently passed to extract_beach_data
     """
 
     if bypass:
         return [base_url]
 
-    main_page = BeautifulSoup(main_html, "html.parser")
-
-    return [
-        base_url.replace("/beachmapp", "") + link.get("href")
-        for link in main_page.find_all("a")
-        if url_path in link.get("href")
-    ]
+    return page_links(base_url, main_html, url_path)
 
 
 @task
 def create_all_beaches_list(base_url, bypass):
+    catalogue = None if bypass else load_catalogue(base_url, "../data/beach_catalogue.json")
     base_html = retrieve_url(base_url)
     region_URLs = create_beach_list(
-        base_url, base_html, "beachmapp/Beaches", bypass)
+        base_url, base_html, BEACHMAPP_SPEC.group_links, bypass)
+    root_hash = links_hash(region_URLs)
+    if catalogue_is_current(catalogue, "root-hash", root_hash=root_hash):
+        return catalogue["beaches"]
     all_beaches = []
     for region_url in region_URLs:
         region = region_url.split("/")[-1]
         region_html = retrieve_url(region_url)
         beaches_list = create_beach_list(
-            base_url, region_html, "/beachmapp/Beach", bypass)
+            base_url, region_html, BEACHMAPP_SPEC.item_links, bypass)
         all_beaches.append([region, beaches_list])
-    return [[region, item] for region, sublist in all_beaches for item in sublist]
+    beaches = [[region, item] for region, sublist in all_beaches for item in sublist]
+    if not bypass:
+        save_catalogue(base_url, beaches, root_hash, "../data/beach_catalogue.json")
+    return beaches
 
 
 def write_daily_beach_data_local(all_beach_daily_data_df, write_local=False):
@@ -164,24 +110,22 @@ def write_daily_beach_data_local(all_beach_daily_data_df, write_local=False):
 def get_daily_beach_data(beachwatch_fields, beaches_url_list, write_local):
     COLUMN_NAMES = ["Retrieved at"] + ["Region"] + \
         list(beachwatch_fields.values())
-    all_beach_daily_data_df = pd.DataFrame(columns=COLUMN_NAMES)
+    rows = []
 
     for region, beach_url in beaches_url_list:
         beachmapp_html = retrieve_url(beach_url)
-        beach_data = scrape_beach_daily_data(beachmapp_html, beachwatch_fields)
+        beach_data = extract_beach_data(beachmapp_html, beachwatch_fields)
         scraped_time = pendulum.now().isoformat()
-        all_beach_daily_data_df.loc[len(all_beach_daily_data_df)] = [
-            scraped_time] + [region] + [value for (value, _) in beach_data]
+        rows.append([scraped_time] + [region] + [value for (value, _) in beach_data])
 
-    all_beach_daily_data_df["Alert"] = all_beach_daily_data_df["Alert"].apply(
-        lambda alist: " ".join(alist))
+    # Build the DataFrame once (rather than a .loc append per beach)
+    all_beach_daily_data_df = pd.DataFrame(rows, columns=COLUMN_NAMES)
+    all_beach_daily_data_df["Alert"] = all_beach_daily_data_df["Alert"].str.join(" ")
 
     write_daily_beach_data_local(all_beach_daily_data_df, write_local)
 
     return all_beach_daily_data_df
 
-# TODO: Could cache list of beaches (as generally not changing) and re-use
-
 # Define Prefect job - schedule, executor and Flow of tasks
 
 
@@ -216,5 +160,5 @@ def main_job():
         BEACHWATCH_FIELDS, beaches_url_list, WRITE_LOCAL)
 
 
-
-# TODO: Check that the data has actually been updated "NN minutes ago" from the "Data last updated" field
+# Note: the check that the data has actually been updated ("Data last updated NN minutes ago")
+#       is done by the freshness check in src/beach_swim_daily_job.py (see src/beach_freshness.py)
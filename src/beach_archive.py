@@ -0,0 +1,186 @@
+# Archive of the raw beach pages, so that past days can be parsed again
+#
+# Every beach page scraped is kept, compressed, in a content-addressed blob store:
+#   data/html_archive/blobs/3f/3f9a...c1.html.zst   (named by the sha256 of the html)
+# so a page identical to one already archived (e.g. from the HTTP cache) is stored only once.
+# A manifest for each day (Sydney date) lists the pages retrieved that day, one JSON line each:
+#   data/html_archive/days/2026-10-18.jsonl   {"retrieved": ..., "region": ..., "beach_url": ..., "sha256": ...}
+# If a beach was retrieved more than once in a day, the last line is that day's page.
+#
+# Blobs are zstd-compressed if the optional zstandard package is installed, otherwise
+# gzipped (.html.gz); both are read back whichever is installed for writing.
+#
+# parse_archived_day re-parses a day from the archive (e.g. after adding a field to
+# BEACHWATCH_FIELDS or fixing the parser) - see backfill_beach_data.
+#
+# evict_archive (run at the end of each scrape, with the HTTP cache's eviction) keeps the
+# last ARCHIVE_KEEP_DAYS days, fewer if their pages take more than ARCHIVE_MAX_BYTES, and
+# removes the blobs that no kept day refers to. Older days can no longer be backfilled.
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import pendulum
+
+from beach_extract import PARSER_BACKEND, extract_beach_data
+from beach_fingerprint import page_fingerprint, record_fingerprint
+from beach_normalise import LOCAL_TIMEZONE
+
+ARCHIVE_PATH = "data/html_archive"
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+ARCHIVE_KEEP_DAYS = 60                    # Days of pages kept
+ARCHIVE_MAX_BYTES = 1024 * 1024 * 1024    # Oldest days are removed beyond this size of blobs
+
+_manifest_lock = threading.Lock()
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _blob_path(sha256, suffix, root=ARCHIVE_PATH):
+    return Path(root, "blobs", sha256[:2], f"{sha256}.html{suffix}")
+
+
+def _manifest_path(day, root=ARCHIVE_PATH):
+    return Path(root, "days", f"{day}.jsonl")
+
+
+def archive_day(retrieved):
+    """
+    The (Sydney) date a page retrieved at the given ISO time is archived under
+    """
+    return pendulum.parse(retrieved).in_tz(LOCAL_TIMEZONE).to_date_string()
+
+
+def write_blob(beachmapp_html, root=ARCHIVE_PATH):
+    """
+    Store the html (if not already stored) and return its sha256
+    """
+    data = beachmapp_html.encode()
+    sha256 = hashlib.sha256(data).hexdigest()
+    if any(_blob_path(sha256, suffix, root).exists() for suffix in (".zst", ".gz")):
+        return sha256
+    zstandard = _zstandard()
+    if zstandard is not None:
+        path, compressed = _blob_path(sha256, ".zst", root), zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        path, compressed = _blob_path(sha256, ".gz", root), gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    # Write then rename so that a concurrent reader (or writer of the same page) never sees a partial blob
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(compressed)
+    os.replace(tmp_path, path)
+    return sha256
+
+
+def read_blob(sha256, root=ARCHIVE_PATH):
+    zst_path = _blob_path(sha256, ".zst", root)
+    if zst_path.exists():
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ImportError(f"The zstandard package is needed to read {zst_path}")
+        return zstandard.ZstdDecompressor().decompress(zst_path.read_bytes()).decode()
+    return gzip.decompress(_blob_path(sha256, ".gz", root).read_bytes()).decode()
+
+
+def archive_page(retrieved, region, beach_url, beachmapp_html, root=ARCHIVE_PATH):
+    """
+    Archive a beach page retrieved at the given ISO time. Returns its sha256
+    """
+    sha256 = write_blob(beachmapp_html, root)
+    line = json.dumps({"retrieved": retrieved, "region": region, "beach_url": beach_url, "sha256": sha256}) + "\n"
+    path = _manifest_path(archive_day(retrieved), root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # One append per line: safe between threads (the lock) and, for lines this short, between processes
+    with _manifest_lock, open(path, "a") as manifest:
+        manifest.write(line)
+    return sha256
+
+
+def archived_days(start_date=None, end_date=None, root=ARCHIVE_PATH):
+    """
+    The archived days ("YYYY-MM-DD") from start_date to end_date (inclusive), in order
+    """
+    days = sorted(path.stem for path in Path(root, "days").glob("*.jsonl"))
+    return [day for day in days if (start_date is None or day >= start_date) and (end_date is None or day <= end_date)]
+
+
+def read_manifest(day, root=ARCHIVE_PATH):
+    """
+    The day's archived pages as {beach URL: manifest entry} (the last entry for each beach)
+    """
+    entries = {}
+    with open(_manifest_path(day, root)) as manifest:
+        for line in manifest:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["beach_url"]] = entry
+    return entries
+
+
+def parse_archived_day(day, beachwatch_fields, root=ARCHIVE_PATH, backend=PARSER_BACKEND):
+    """
+    Parse the day's archived pages into rows of daily data, as scrape_beach_row makes them:
+    [retrieved, region, beach URL] + values + [page hash, record hash].
+    Only uses plain arguments and results, so it can be run in a worker process
+    """
+    rows = []
+    for entry in read_manifest(day, root).values():
+        beachmapp_html = read_blob(entry["sha256"], root)
+        values = [value for value, _ in extract_beach_data(beachmapp_html, beachwatch_fields, backend)]
+        rows.append([entry["retrieved"], entry["region"], entry["beach_url"]] + values
+                    + [page_fingerprint(beachmapp_html), record_fingerprint(values, beachwatch_fields)])
+    return rows
+
+
+def _manifest_blobs(day, root=ARCHIVE_PATH):
+    """
+    The sha256 of every page in the day's manifest (not just the last for each beach)
+    """
+    with open(_manifest_path(day, root)) as manifest:
+        return {json.loads(line)["sha256"] for line in manifest if line.strip()}
+
+
+def evict_archive(root=ARCHIVE_PATH, keep_days=ARCHIVE_KEEP_DAYS, max_bytes=ARCHIVE_MAX_BYTES):
+    """
+    Remove the days older than keep_days (before today in Sydney), then the oldest days until
+    the blobs of the days left take no more than max_bytes (the latest day is always kept),
+    then the blobs that no day left refers to. Returns the days removed
+    """
+    blobs_path = Path(root, "blobs")
+    days = archived_days(root=root)
+    if not days:
+        return []
+    blob_sizes = {path.name.split(".", 1)[0]: path.stat().st_size
+                  for path in blobs_path.glob("*/*.html.*") if not path.name.endswith(".tmp")}
+    oldest = pendulum.now(LOCAL_TIMEZONE).subtract(days=keep_days).to_date_string()
+
+    kept, referenced, total_bytes = [], set(), 0
+    for day in reversed(days):   # Newest first
+        if day < oldest:
+            break
+        day_blobs = _manifest_blobs(day, root) - referenced
+        day_bytes = sum(blob_sizes.get(sha256, 0) for sha256 in day_blobs)
+        if kept and total_bytes + day_bytes > max_bytes:
+            break
+        kept.append(day)
+        referenced |= day_blobs
+        total_bytes += day_bytes
+
+    removed = [day for day in days if day not in kept]
+    for day in removed:
+        _manifest_path(day, root).unlink(missing_ok=True)
+    for path in blobs_path.glob("*/*.html.*"):
+        if not path.name.endswith(".tmp") and path.name.split(".", 1)[0] not in referenced:
+            path.unlink(missing_ok=True)
+    return removed
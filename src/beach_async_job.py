@@ -0,0 +1,276 @@
+# Async-native version of the daily beach job
+#
+# beach_data_daily_job_async runs the same steps as beach_data_daily_job (catalogue,
+# freshness check, scrape, normalise, write - see beach_swim_daily_job), but as async
+# flows and tasks on one event loop, so that waiting on the network never holds up
+# other work:
+#   - the region pages, then all the beach pages, are fetched concurrently on the loop
+#     with one pooled client (see beach_fetch), and each beach page is archived and
+#     parsed as soon as it arrives, while the others are still being fetched
+#   - the blocking work is offloaded: parsing to the parse pool (see ParsePool.parse),
+#     and the archiving, normalising, freshness check and sink writers (S3 included) to threads
+# Scheduling overhead stays off the fetching path: each flow has a few tasks, not a
+# task per page (as in the mapped flow).
+#
+# A sync task called from an async flow blocks the event loop, so every task here is async.
+# Blocking calls go through asyncio.to_thread, which (unlike loop.run_in_executor) carries
+# the Prefect run context into the thread, so they can still log.
+# The knobs (USE_HTTP_CACHE, CHECKPOINT_RUNS, N_BEACH_TESTING, ...) are those of
+# beach_swim_daily_job; SCRAPE_MODE does not apply.
+
+import asyncio
+from typing import List
+
+import pandas as pd
+import pendulum
+from prefect import flow, get_run_logger, task
+from prefect.orion.schemas.states import Completed
+
+import beach_swim_daily_job as daily_job
+from beach_catalogue import REFRESH_POLICY, catalogue_is_current, links_hash, load_catalogue, save_catalogue
+from beach_checkpoint import RunJournal, today
+from beach_fetch import async_client, async_retrieve_url, async_retrieve_urls
+from beach_fingerprint import store_fingerprints
+from beach_metrics import METRICS
+from beach_normalise import normalise_daily_beach_data
+from beach_parse_pool import ParsePool
+from beach_sqlite import SQLITE_DB_PATH, open_beach_db
+from beach_swim_daily_job import (append_daily_data_row, cached_beach_values, check_beach_data_freshness,
+                                  create_beach_list, daily_data_columns_to_df, finish_beach_row, finish_parsed_row,
+                                  journal_columns, known_fingerprints, log_changed_beaches, new_daily_data_columns,
+                                  pending_beaches, report_run_metrics, report_sink_states, start_beach_row,
+                                  with_unchanged_beaches, write_sink)
+from beach_writers import SINK_DEPENDENCIES, enabled_sinks
+from http_cache import HTTP_CACHE
+from site_spec import BEACHMAPP_BASE_URL, BEACHMAPP_SPEC, BEACHWATCH_FIELDS
+
+
+def http_cache():
+    return HTTP_CACHE if daily_job.USE_HTTP_CACHE else None
+
+
+@task
+async def retrieve_pages_async(urls: List[str]) -> List[str]:
+    """
+    Retrieve the pages concurrently on the flow's event loop. Returns the html for each URL in order
+    """
+    return await async_retrieve_urls(urls, cache=http_cache())
+
+
+# Subflows
+
+@flow(name="Create all beaches list (async)")
+async def create_all_beaches_list_async(base_url: str, bypass: bool, refresh_policy: str = REFRESH_POLICY) -> List:
+    """
+    create_all_beaches_list on the event loop: all the region pages are fetched at once
+    """
+    catalogue = None if bypass else await asyncio.to_thread(load_catalogue, base_url)
+    if refresh_policy == "ttl" and catalogue_is_current(catalogue, refresh_policy):
+        return catalogue["beaches"]
+
+    base_html, = await retrieve_pages_async([base_url])
+    region_urls = create_beach_list.fn(base_url, base_html, BEACHMAPP_SPEC.group_links, bypass)
+    root_hash = links_hash(region_urls)
+    if catalogue_is_current(catalogue, refresh_policy, root_hash=root_hash):
+        return catalogue["beaches"]
+
+    region_htmls = await retrieve_pages_async(region_urls)
+    beaches_lists = await asyncio.gather(*[
+        asyncio.to_thread(create_beach_list.fn, base_url, region_html, BEACHMAPP_SPEC.item_links, bypass)
+        for region_html in region_htmls
+    ])
+    beaches = [[region_url.split("/")[-1], beach_url]
+               for region_url, beaches_list in zip(region_urls, beaches_lists) for beach_url in beaches_list]
+    if not bypass:
+        await asyncio.to_thread(save_catalogue, base_url, beaches, root_hash)
+    return beaches
+
+
+async def scrape_beach_row_async(pool, region, beach_url, beachmapp_html, beachwatch_fields, known=None):
+    """
+    scrape_beach_row without blocking the event loop: the page is archived and hashed
+    in a thread, and parsed by the pool
+    """
+    def start():
+        started = start_beach_row(region, beach_url, beachmapp_html, known)
+        return started, None if started is None else cached_beach_values(beach_url, beachwatch_fields)
+
+    started, beach_values = await asyncio.to_thread(start)
+    if started is None:
+        return None
+    if beach_values is not None:
+        return finish_beach_row(region, beach_url, *started, beach_values, beachwatch_fields, known)
+    parsed = await pool.parse(beachmapp_html)
+    return await asyncio.to_thread(finish_parsed_row, region, beach_url, *started, parsed, beachwatch_fields, known)
+
+
+@task
+async def scrape_beaches_async(beachwatch_fields: dict, beaches_url_list: List, journal=None, skip_unchanged=True):
+    """
+    Fetch every beach page concurrently and turn each into a row of daily data as soon as
+    it arrives (recording it in the run journal, if any).
+    Returns ({beach URL: row} for the beaches that changed, [beach URLs that could not be retrieved])
+    """
+    logger = get_run_logger()
+    known = await asyncio.to_thread(known_fingerprints, skip_unchanged)
+    cache = http_cache()
+    rows, failed = {}, []
+
+    async def scrape(client, pool, region, beach_url):
+        try:
+            beachmapp_html = await async_retrieve_url(client, beach_url, cache=cache)
+        except Exception as e:
+            logger.error(f"Could not retrieve {beach_url}: {e}")
+            failed.append(beach_url)
+            return
+        row = await scrape_beach_row_async(pool, region, beach_url, beachmapp_html, beachwatch_fields,
+                                           known.get(beach_url))
+        if row is not None:
+            rows[beach_url] = row
+        # The journal is written on the loop's thread, as its SQLite connection is tied to it
+        if journal is not None and row is None:
+            journal.record_unchanged([beach_url])
+        elif journal is not None:
+            journal.record([row])
+
+    with ParsePool(beachwatch_fields) as pool:
+        async with async_client() as client:
+            await asyncio.gather(*[scrape(client, pool, region, beach_url) for region, beach_url in beaches_url_list])
+    return rows, failed
+
+
+@flow(name="Get daily beach data (async)")
+async def get_daily_beach_data_async(beachwatch_fields: dict, beaches_url_list: List,
+                                     checkpoint_date: str = None, skip_unchanged: bool = True) -> pd.DataFrame:
+    """
+    get_daily_beach_data on the event loop: fetching, archiving and parsing of the pages all
+    overlap. With a checkpoint_date only the beaches not already in the run journal are fetched.
+    If any page could not be retrieved the flow fails (after recording the rest, if checkpointed)
+    """
+    logger = get_run_logger()
+    beaches_url_list = beaches_url_list[:daily_job.N_BEACH_TESTING]
+    journal = RunJournal(checkpoint_date) if checkpoint_date is not None else None
+    pending = pending_beaches(beaches_url_list, journal)
+    if journal is not None:
+        logger.info(f"Run {journal.run_date}: {len(beaches_url_list) - len(pending)} beaches already scraped, "
+                    f"fetching {len(pending)}")
+
+    rows, failed = await scrape_beaches_async(beachwatch_fields, pending, journal, skip_unchanged)
+    log_changed_beaches(len(rows), len(pending) - len(failed))
+    if failed:
+        raise RuntimeError(f"Could not retrieve {len(failed)} beaches"
+                           + (" (rerun to fetch just these)" if journal is not None else ""))
+
+    if journal is not None:
+        columns = journal_columns(journal, beachwatch_fields, beaches_url_list)
+    else:
+        columns = new_daily_data_columns(beachwatch_fields)
+        for _, beach_url in beaches_url_list:   # In the order of the list, as the rows are made in any order
+            if beach_url in rows:
+                append_daily_data_row(columns, rows[beach_url])
+    all_daily_data_df = await asyncio.to_thread(daily_data_columns_to_df, columns)
+    await asyncio.to_thread(daily_job.evict_caches)
+
+    return all_daily_data_df
+
+
+@task
+async def write_sink_async(sink, all_daily_data_df, run_time):
+    """
+    write_sink in a thread (the writers, including the S3 uploads, block)
+    """
+    return await asyncio.to_thread(write_sink.fn, sink, all_daily_data_df, run_time)
+
+
+@flow(name="Write daily beach data (async)")
+async def write_daily_beach_data_async(all_daily_data_df, write_local=False):
+    """
+    write_daily_beach_data_local with each sink written in its own thread
+    """
+    run_time = pendulum.now()
+    futures = {}
+    for sink in enabled_sinks(write_local):
+        upstream = [futures[dependency] for dependency in SINK_DEPENDENCIES.get(sink, []) if dependency in futures]
+        futures[sink] = await write_sink_async.submit(sink, all_daily_data_df, run_time, wait_for=upstream)
+
+    report_sink_states({sink: await future.wait() for sink, future in futures.items()})
+    await asyncio.to_thread(lambda: store_fingerprints(open_beach_db(SQLITE_DB_PATH), all_daily_data_df))
+
+
+@task
+async def check_beach_data_freshness_async(beaches_url_list):
+    return await asyncio.to_thread(check_beach_data_freshness.fn, beaches_url_list)
+
+
+@task
+async def normalise_beach_data_async(all_daily_data_df, beachwatch_fields):
+    return await asyncio.to_thread(normalise_daily_beach_data, all_daily_data_df, beachwatch_fields)
+
+
+# Main flow
+
+@flow(name="Main flow: daily-beach-data-job (async)")
+async def beach_data_daily_job_async(rerun: bool = False):
+    """
+    beach_data_daily_job as async flows on one event loop (see the top of this module);
+    checkpointing, the freshness check and the run metrics work in the same way
+    """
+    METRICS.reset()
+    try:
+        with METRICS.stage("run"):
+            return await run_daily_job_async(rerun)
+    finally:
+        report_run_metrics()
+
+
+async def run_daily_job_async(rerun=False):
+    journal = RunJournal(today()) if daily_job.CHECKPOINT_RUNS else None
+    if journal is not None and rerun:
+        journal.reset()
+    complete = journal is not None and journal.is_complete()
+    if complete and not daily_job.CHECK_FRESHNESS:
+        print(f"\nSkipping: the run for {journal.run_date} is already complete\n")
+        return
+
+    with METRICS.stage("catalogue"):
+        beaches_url_list = await create_all_beaches_list_async(BEACHMAPP_BASE_URL, False)
+    resuming = journal is not None and journal.is_unfinished()
+    if daily_job.CHECK_FRESHNESS and not rerun and not resuming:
+        with METRICS.stage("freshness check"):
+            is_new, message = await check_beach_data_freshness_async(beaches_url_list)
+        if not is_new:
+            return Completed(message=message)
+        if complete:
+            journal.reset()   # Beachmapp has been updated since today's run completed: run again
+    if journal is None:
+        return await scrape_and_write_daily_data_async(beaches_url_list, rerun=rerun)
+    with journal.running():   # Marked as failed if this raises, so the next run resumes it
+        return await scrape_and_write_daily_data_async(beaches_url_list, journal, rerun)
+
+
+async def scrape_and_write_daily_data_async(beaches_url_list, journal=None, rerun=False):
+    write_local = False
+    checkpoint_date = journal.run_date if journal is not None else None
+    with METRICS.stage("scrape"):
+        all_daily_data_df = await get_daily_beach_data_async(BEACHWATCH_FIELDS, beaches_url_list, checkpoint_date,
+                                                             skip_unchanged=not rerun)
+    if all_daily_data_df.empty:
+        if journal is not None:
+            journal.reset()   # Nothing new was written, so later runs today check for new data again
+        return Completed(message="No beaches changed: nothing to write")
+    with METRICS.stage("normalise"):
+        all_daily_data_df = await normalise_beach_data_async(all_daily_data_df, BEACHWATCH_FIELDS)
+        all_daily_data_df = await asyncio.to_thread(with_unchanged_beaches, all_daily_data_df, beaches_url_list)
+    if daily_job.N_BEACH_TESTING == 160:
+        with METRICS.stage("write"):
+            await write_daily_beach_data_async(all_daily_data_df, write_local)   # Fails this flow if a sink fails
+        if journal is not None:
+            journal.mark_complete(len(all_daily_data_df))
+    else:
+        if journal is not None:
+            journal.reset()
+        print("\nSkipping data write: Test run only\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(beach_data_daily_job_async())
@@ -0,0 +1,66 @@
+# Persistent catalogue of the beach URLs for each region
+#
+# The list of regions and beaches rarely changes, so rather than re-discovering
+# it (root page + about a dozen region pages) on every run it is stored in a
+# JSON index and only rebuilt when the refresh policy says it is stale:
+#   "ttl"       - rebuild once the catalogue is older than CATALOGUE_TTL_SECONDS
+#   "root-hash" - fetch the root page only and rebuild if its region links have
+#                 changed (or the catalogue is older than CATALOGUE_TTL_SECONDS)
+#   "always"    - rebuild every run (the previous behaviour)
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+CATALOGUE_PATH = "data/beach_catalogue.json"
+REFRESH_POLICY = "root-hash"
+CATALOGUE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+def links_hash(urls):
+    """
+    Fingerprint of a list of URLs (e.g. the region links on the root page)
+    """
+    return hashlib.sha256("\n".join(sorted(urls)).encode()).hexdigest()
+
+
+def load_catalogue(base_url, path=CATALOGUE_PATH):
+    """
+    Returns the stored catalogue for base_url, or None if there isn't one
+    """
+    try:
+        catalogue = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    return catalogue if catalogue.get("base_url") == base_url else None
+
+
+def save_catalogue(base_url, beaches, root_hash, path=CATALOGUE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    catalogue = {
+        "base_url": base_url,
+        "created": time.time(),
+        "root_hash": root_hash,
+        "beaches": beaches,
+    }
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(catalogue, indent=1))
+    os.replace(tmp_path, path)
+    return catalogue
+
+
+def catalogue_is_current(catalogue, refresh_policy=REFRESH_POLICY, ttl_seconds=CATALOGUE_TTL_SECONDS, root_hash=None):
+    """
+    Decide whether the stored catalogue can be used instead of re-discovering all the beaches.
+    For the "root-hash" policy root_hash is the links_hash of the current root page links
+    """
+    if catalogue is None or refresh_policy == "always":
+        return False
+    if time.time() - catalogue["created"] > ttl_seconds:
+        return False
+    if refresh_policy == "root-hash":
+        return catalogue["root_hash"] == root_hash
+    return True
@@ -0,0 +1,158 @@
+# Checkpoints for resumable daily scrape runs
+#
+# Each beach is recorded in a local SQLite journal, keyed by the run date (Sydney
+# time) and beach URL, as soon as its page has been scraped (beaches skipped as
+# unchanged are recorded without a row). If a run fails part
+# way through (e.g. one page still failing after its retries) then a rerun or retry
+# on the same day only fetches the beaches that are not yet in the journal, and the
+# day's data is put together from the journal.
+#
+# Each run has a status: "running" from the start of the scrape until it finishes,
+# or "failed" if it raised. Only a run left running or failed is resumed. Once the
+# write stage has finished the run is marked "complete", so that later runs on the
+# same day do not write / publish the data again - unless the freshness check finds
+# that Beachmapp has been updated since, when the run is reset. A run that found
+# nothing new to write (e.g. every beach unchanged, as Beachmapp had not updated yet)
+# is forgotten instead, so that later runs that day check for new data again.
+
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+import pendulum
+from sqlite_utils import Database
+
+from beach_normalise import LOCAL_TIMEZONE
+
+JOURNAL_PATH = "data/run_journal.sqlite"
+JOURNAL_KEEP_DAYS = 14   # Runs older than this are removed from the journal
+BEACHES_TABLE = "run_beaches"
+RUNS_TABLE = "runs"
+RUNNING, FAILED, COMPLETE = "running", "failed", "complete"
+
+
+def today():
+    """
+    The run date used as the journal key: today's date in Sydney, as "YYYY-MM-DD"
+    """
+    return pendulum.now(LOCAL_TIMEZONE).to_date_string()
+
+
+class RunJournal:
+    def __init__(self, run_date=None, path=JOURNAL_PATH):
+        self.run_date = run_date or today()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = Database(path)
+        self.db.enable_wal()
+        if not self.db[BEACHES_TABLE].exists():
+            self.db[BEACHES_TABLE].create({"run_date": str, "beach_url": str, "row": str},
+                                          pk=("run_date", "beach_url"))
+        if not self.db[RUNS_TABLE].exists():
+            self.db[RUNS_TABLE].create({"run_date": str, "status": str, "completed": str, "beaches": int},
+                                       pk="run_date")
+        elif "status" not in self.db[RUNS_TABLE].columns_dict:
+            # Journals from before the run status: every run recorded there was complete
+            self.db[RUNS_TABLE].add_column("status", str)
+            self.db.execute(f"UPDATE {RUNS_TABLE} SET status = ?", [COMPLETE])
+
+    def done_urls(self):
+        """
+        The beach URLs already scraped in this run
+        """
+        return {url for (url,) in self.db.execute(
+            f"SELECT beach_url FROM {BEACHES_TABLE} WHERE run_date = ?", [self.run_date])}
+
+    def record(self, rows):
+        """
+        Record scraped rows of daily data ([retrieved, region, beach URL] + values),
+        in a single transaction
+        """
+        with self.db.conn:
+            self.db.conn.executemany(
+                f"INSERT OR REPLACE INTO {BEACHES_TABLE} (run_date, beach_url, row) VALUES (?, ?, ?)",
+                [(self.run_date, row[2], json.dumps(row)) for row in rows])
+
+    def record_unchanged(self, beach_urls):
+        """
+        Record beaches scraped in this run whose data is unchanged (so have no row to write)
+        """
+        with self.db.conn:
+            self.db.conn.executemany(
+                f"INSERT OR REPLACE INTO {BEACHES_TABLE} (run_date, beach_url, row) VALUES (?, ?, NULL)",
+                [(self.run_date, beach_url) for beach_url in beach_urls])
+
+    def rows(self):
+        """
+        All the rows recorded in this run, by beach URL (not including the unchanged beaches)
+        """
+        return {url: json.loads(row) for url, row in self.db.execute(
+            f"SELECT beach_url, row FROM {BEACHES_TABLE} WHERE run_date = ? AND row IS NOT NULL", [self.run_date])}
+
+    def status(self):
+        """
+        The run's status (RUNNING, FAILED or COMPLETE), or None if it has not started
+        """
+        for (status,) in self.db.execute(f"SELECT status FROM {RUNS_TABLE} WHERE run_date = ?", [self.run_date]):
+            return status
+        return None
+
+    def is_complete(self):
+        return self.status() == COMPLETE
+
+    def is_unfinished(self):
+        """
+        True if an earlier attempt of this run did not finish (it failed, or was stopped
+        while running), so this attempt should resume it
+        """
+        return self.status() in (RUNNING, FAILED)
+
+    def _set_status(self, status):
+        with self.db.conn:
+            self.db.conn.execute(f"INSERT INTO {RUNS_TABLE} (run_date, status) VALUES (?, ?) "
+                                 f"ON CONFLICT (run_date) DO UPDATE SET status = excluded.status",
+                                 [self.run_date, status])
+
+    @contextmanager
+    def running(self):
+        """
+        Mark the run as running for the duration of the with block, and as failed if it raises
+        """
+        self._set_status(RUNNING)
+        try:
+            yield self
+        except BaseException:
+            self._set_status(FAILED)
+            raise
+
+    def finish(self, n_beaches):
+        """
+        Mark the run as complete if it wrote any rows, otherwise forget it (see reset).
+        Returns True if it was marked complete
+        """
+        if not self.rows():
+            self.reset()
+            return False
+        self.mark_complete(n_beaches)
+        return True
+
+    def mark_complete(self, n_beaches):
+        """
+        Mark the run as complete (written / published) and remove old runs from the journal
+        """
+        with self.db.conn:
+            self.db.conn.execute(f"INSERT OR REPLACE INTO {RUNS_TABLE} (run_date, status, completed, beaches) "
+                                 f"VALUES (?, ?, ?, ?)",
+                                 [self.run_date, COMPLETE, pendulum.now("UTC").isoformat(), n_beaches])
+            oldest = pendulum.parse(self.run_date).subtract(days=JOURNAL_KEEP_DAYS).to_date_string()
+            for table in (BEACHES_TABLE, RUNS_TABLE):
+                self.db.conn.execute(f"DELETE FROM {table} WHERE run_date < ?", [oldest])
+
+    def reset(self):
+        """
+        Forget this run (so that everything is fetched and written again).
+        The rows already written by the run are replaced as they are written again
+        (the sinks keep one row per beach and day)
+        """
+        with self.db.conn:
+            for table in (BEACHES_TABLE, RUNS_TABLE):
+                self.db.conn.execute(f"DELETE FROM {table} WHERE run_date = ?", [self.run_date])
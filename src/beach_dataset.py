@@ -0,0 +1,135 @@
+# History of the daily beach data as a partitioned parquet dataset
+#
+# Each run writes its rows into hive-style partitions by day and region:
+#   data/beach_daily_dataset/date=2026-10-18/Region=Sydney/part-0.parquet
+# Writing rows merges them into their partitions: a partition's rows for other beaches
+# are kept and a beach's row for the day is replaced, so the rows can be written in
+# batches, or just those for the beaches that changed, and re-running a day is idempotent.
+# Partitions without new rows are never rewritten. The files are zstd-compressed and
+# keep the compact (normalised) dtypes. A column that only the new rows or only the
+# stored rows have (e.g. a field added to BEACHWATCH_FIELDS, then backfilled) is kept,
+# with nulls for the rows without it.
+#
+# read_beach_history only reads the partitions (days / regions) and columns asked for.
+
+from pathlib import Path
+from urllib.parse import unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from beach_normalise import data_date
+
+DATASET_PATH = "data/beach_daily_dataset"
+S3_DATASET_PREFIX = "beach_daily_dataset"
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string()), ("Region", pa.string())]), flavor="hive")
+COMPRESSION = "zstd"
+
+
+def _with_schema(table, schema):
+    """
+    The table with the columns of schema, in that order and cast to its types,
+    adding any column that the table does not have as nulls
+    """
+    columns = [table[field.name] if field.name in table.column_names else pa.nulls(len(table), field.type)
+               for field in schema]
+    return pa.Table.from_arrays(columns, names=schema.names).cast(schema)
+
+
+def _merge_existing_rows(table, df, root):
+    """
+    The rows already in the partitions of df (which has the date column), less those
+    that it replaces (same beach and day), followed by the rows of table (made from df)
+    """
+    existing_files = partition_files(df, root)
+    if not existing_files:
+        return table
+    existing = ds.dataset(existing_files, format="parquet", partitioning=PARTITIONING,
+                          partition_base_dir=str(root)).to_table()
+    # The new rows' types, plus the stored rows' columns that the new rows do not have
+    schema = pa.schema(list(table.schema) + [field for field in existing.schema
+                                             if field.name not in table.column_names],
+                       metadata=table.schema.metadata)
+    existing, table = _with_schema(existing, schema), _with_schema(table, schema)
+
+    def row_keys(rows):
+        return pd.MultiIndex.from_arrays([rows["Beach URL"].astype(str), rows["date"].astype(str)])
+
+    replaced = row_keys(existing.select(["Beach URL", "date"]).to_pandas()).isin(row_keys(df))
+    return pa.concat_tables([existing.filter(pa.array(~replaced)), table])
+
+
+def write_dataset_partitions(all_daily_data_df, root=DATASET_PATH):
+    """
+    Merge the rows into their day / region partitions, replacing any earlier row for
+    the same beach and day (see the top of this module). If the rows include more than
+    one for a beach and day, the last is kept.
+    Returns the paths of the files written
+    """
+    df = all_daily_data_df.assign(date=data_date(all_daily_data_df))
+    df = df.drop_duplicates(["Beach URL", "date"], keep="last")
+    df["Region"] = df["Region"].astype("string")
+    table = _merge_existing_rows(pa.Table.from_pandas(df, preserve_index=False), df, root)
+    written = []
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+        file_visitor=lambda written_file: written.append(written_file.path),
+    )
+    return written
+
+
+def partition_files(all_daily_data_df, root=DATASET_PATH):
+    """
+    Paths of the dataset files for the day / region partitions of the given rows
+    """
+    partitions = set(zip(data_date(all_daily_data_df), all_daily_data_df["Region"].astype("string")))
+    return sorted(
+        str(path)
+        for day in {day for day, _ in partitions}
+        for path in Path(root, f"date={day}").glob("Region=*/*.parquet")
+        if (day, unquote(path.parent.name.split("=", 1)[1])) in partitions
+    )
+
+
+def dataset_s3_keys(paths, root=DATASET_PATH, prefix=S3_DATASET_PREFIX):
+    """
+    S3 object names for dataset files, keeping the partition directories
+    """
+    return [f"{prefix}/{Path(path).relative_to(root).as_posix()}" for path in paths]
+
+
+def s3_filesystem():
+    """
+    pyarrow filesystem for reading the dataset directly from the S3 bucket,
+    e.g. read_beach_history(f"{bucket_name}/{S3_DATASET_PREFIX}", filesystem=s3_filesystem())
+    """
+    from pyarrow.fs import S3FileSystem
+    from scaleway_s3_storage import ACCESS_KEY_ID, ENDPOINT_URL, REGION_NAME, SECRET_ACCESS_KEY
+    return S3FileSystem(access_key=ACCESS_KEY_ID, secret_key=SECRET_ACCESS_KEY,
+                        region=REGION_NAME, endpoint_override=ENDPOINT_URL)
+
+
+def read_beach_history(root=DATASET_PATH, start_date=None, end_date=None, regions=None, columns=None,
+                       filesystem=None):
+    """
+    Read the daily beach data for the days from start_date to end_date ("YYYY-MM-DD", inclusive)
+    and the given regions (all if not specified), with just the given columns.
+    Only the matching partitions are opened
+    """
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, filesystem=filesystem)
+    condition = None
+    for clause in [
+        ds.field("date") >= start_date if start_date else None,
+        ds.field("date") <= end_date if end_date else None,
+        ds.field("Region").isin(regions) if regions else None,
+    ]:
+        if clause is not None:
+            condition = clause if condition is None else condition & clause
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,209 @@
+# Single-pass extraction of the Beachwatch fields from a beach page
+#
+# Rather than searching the whole parsed page once or twice per field (find("div")
+# then find("span")), the page is walked once to build an index of
+# (tag, class name) -> elements for the class names of interest, and each field
+# is then a dictionary lookup.
+#
+# The fields are given either as a site's field specs (see site_spec) or as
+# {class name: item name} (as BEACHWATCH_FIELDS), and extraction_plan compiles either,
+# once, into an ExtractionPlan - the index keys to look up for each field, in order of
+# preference, whether it has one value or many, and its default - so each page is a
+# tight loop of lookups, with missing fields given their default rather than raising
+# and catching an exception. print(plan) shows what it will do.
+#
+# Backends:
+#   "html.parser" - BeautifulSoup with the standard library parser (same tree as before)
+#   "lxml"        - lxml.html directly (much faster, needs the optional lxml package),
+#                   giving the same strings as BeautifulSoup (see first_content)
+
+from typing import NamedTuple, Tuple
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+PARSER_BACKEND = "html.parser"
+MULTI_VALUE_FIELDS = {"bw-alert-text"}   # Fields with one value per matching div
+DEFAULT_TAGS = ("div", "span")
+ASCII_SPACES = " \n\t\x0c\r"                  # As BeautifulSoup, which collapses strings of only these
+PRESERVE_WHITESPACE_TAGS = ("pre", "textarea")  # unless they are inside one of these tags
+
+
+class FieldSelector(NamedTuple):
+    classname: str
+    name: str
+    tags: Tuple[str, ...]   # In order of preference
+    multi: bool
+    default: str            # The value when the field is missing (by default its class name)
+
+
+def _field_selectors(fields):
+    """
+    FieldSelectors for {class name: item name} (a multi-value field if in MULTI_VALUE_FIELDS,
+    looking only in divs) or for field specs (see site_spec.FieldSpec).
+    FieldSelectors are returned as they are
+    """
+    if isinstance(fields, dict):
+        return tuple(
+            FieldSelector(classname, name, ("div",), True, classname) if classname in MULTI_VALUE_FIELDS
+            else FieldSelector(classname, name, DEFAULT_TAGS, False, classname)
+            for classname, name in fields.items()
+        )
+    return tuple(field if isinstance(field, FieldSelector)
+                 else FieldSelector(field.classname, field.name, tuple(field.tags), field.multi,
+                                    field.classname if field.default is None else field.default)
+                 for field in fields)
+
+
+class ExtractionPlan:
+    """
+    The fields to extract from a page, compiled once: the class names and tags to index,
+    and for each field its (tag, class name) index keys in order of preference, whether
+    it is multi-valued and its default, so extracting a page is a loop of lookups.
+    A missing field (no matching element, or an empty one) is its default: no exceptions.
+    Plans are plain data, so they can be sent to worker processes (see beach_parse_pool)
+    """
+
+    def __init__(self, fields):
+        self.fields = _field_selectors(fields)
+        self.classnames = frozenset(field.classname for field in self.fields)
+        self.tags = tuple(dict.fromkeys(tag for field in self.fields for tag in field.tags))
+        self.steps = tuple(
+            (tuple((tag, field.classname) for tag in field.tags), field.multi, field.default, field.name)
+            for field in self.fields
+        )
+
+    def extract(self, beachmapp_html, backend=PARSER_BACKEND):
+        """
+        [(value, item name), ...] for the page, in field order. A multi-value field's
+        value is a list (empty if there are no matching elements)
+        """
+        index = build_class_index(beachmapp_html, self.classnames, backend, self.tags)
+        beach_data = []
+        for keys, multi, default, item_name in self.steps:
+            item = default
+            if multi:
+                values = [first_content(el, backend) for key in keys for el in index.get(key, ())]
+                if None not in values:
+                    item = values
+            else:
+                for key in keys:
+                    elements = index.get(key)
+                    if elements:
+                        content = first_content(elements[0], backend)
+                        if content is not None:
+                            item = content
+                        break
+            beach_data.append((item, item_name))
+        return beach_data
+
+    def describe(self):
+        """
+        A dict for each field: its name, class name, tags (in order of preference), multi and default
+        """
+        return [field._asdict() for field in self.fields]
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __eq__(self, other):
+        return isinstance(other, ExtractionPlan) and self.fields == other.fields
+
+    def __repr__(self):
+        lines = [f"ExtractionPlan({len(self.fields)} fields, indexing {', '.join(self.tags)}):"]
+        for field in self.fields:
+            lookups = " | ".join(f"{tag}.{field.classname}" for tag in field.tags)
+            lines.append(f"  {field.name!r}: {'all of ' if field.multi else ''}{lookups}, default {field.default!r}")
+        return "\n".join(lines)
+
+
+_plans = {}   # {class name: item name} items, or FieldSelectors -> ExtractionPlan
+
+
+def extraction_plan(fields):
+    """
+    The ExtractionPlan for {class name: item name}, field specs or FieldSelectors (an
+    ExtractionPlan is returned as it is). Plans are cached, so passing BEACHWATCH_FIELDS
+    for every page compiles it only once
+    """
+    if isinstance(fields, ExtractionPlan):
+        return fields
+    key = tuple(fields.items()) if isinstance(fields, dict) else _field_selectors(fields)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = ExtractionPlan(fields)
+    return plan
+
+
+def build_class_index(beachmapp_html, classnames, backend=PARSER_BACKEND, tags=DEFAULT_TAGS):
+    """
+    Parse the page and return {(tag, classname): [elements in document order]}
+    for the elements (of the given tags) having one of the given class names
+    """
+    index = {}
+    if backend == "lxml":
+        import lxml.html
+        root = lxml.html.fromstring(beachmapp_html)
+        elements = ((el, el.get("class", "").split()) for el in root.iter(*tags))
+        for el, classes in elements:
+            for classname in classes:
+                if classname in classnames:
+                    index.setdefault((el.tag, classname), []).append(el)
+    else:
+        beach_soup = BeautifulSoup(beachmapp_html, "html.parser")
+        for el in beach_soup.find_all(list(tags), class_=True):
+            for classname in el["class"]:
+                if classname in classnames:
+                    index.setdefault((el.name, classname), []).append(el)
+    return index
+
+
+def first_content(element, backend=PARSER_BACKEND):
+    """
+    Returns the first child (text or markup) of the element as a string,
+    the equivalent of str(element.contents[0]) in BeautifulSoup,
+    or None if the element is empty
+    """
+    if backend == "lxml":
+        return _lxml_first_content(element)
+    return str(element.contents[0]) if element.contents else None
+
+
+def _lxml_first_content(element):
+    """
+    first_content for an lxml element, as BeautifulSoup (html.parser) gives it: text of
+    only whitespace is collapsed to "\n" or " ", and a first child that is markup (an
+    element, a comment, ...) is serialised by BeautifulSoup (e.g. "<br/>", and a comment
+    is just its text). The markup is rare in the fields, so is handed to BeautifulSoup
+    rather than reproducing its serialisation
+    """
+    text = element.text
+    if text:
+        if text.strip(ASCII_SPACES) or element.tag in PRESERVE_WHITESPACE_TAGS \
+                or any(True for _ in element.iterancestors(*PRESERVE_WHITESPACE_TAGS)):
+            return text
+        return "\n" if "\n" in text else " "
+    if len(element) == 0:
+        return None
+    import lxml.html
+    markup = lxml.html.tostring(element[0], encoding="unicode", with_tail=False)
+    contents = BeautifulSoup(markup, "html.parser").contents
+    return str(contents[0]) if contents else None
+
+
+def extract_beach_data(beachmapp_html, beachwatch_fields, backend=PARSER_BACKEND):
+    """
+    Returns [(value, item_name), ...] for a beach page, as get_all_data_for_beach does,
+    including using the class name as the value when a field is missing.
+    beachwatch_fields is {class name: item name}, FieldSelectors or an ExtractionPlan
+    (see extraction_plan)
+    """
+    return extraction_plan(beachwatch_fields).extract(beachmapp_html, backend)
+
+
+def page_links(base_url, page_html, url_path):
+    """
+    The absolute URLs of the links on the page whose href contains url_path, in page order
+    """
+    page = BeautifulSoup(page_html, "html.parser")
+    return [urljoin(base_url, link.get("href")) for link in page.find_all("a", href=True) if url_path in link.get("href")]
@@ -0,0 +1,203 @@
+# Concurrent async fetching of Beachmapp pages
+#
+# One pooled httpx.AsyncClient is shared by every request in a batch.
+# In-flight requests are capped overall by the client's connection pool, and the
+# rate and number of in-flight requests to each host adapt to how the host is coping
+# (see beach_throttle). Failed requests (connection errors, timeouts, 408 / 429 / 5xx)
+# are retried with jittered exponential backoff, waiting at least as long as any
+# Retry-After; other error responses (e.g. 404) are not retried.
+# The HTTP cache's files are read and written in a thread, off the event loop.
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Iterator, List, Tuple, Union
+
+import httpx
+
+from beach_metrics import METRICS
+from beach_throttle import RETRY_STATUS_CODES, host_throttle, retry_after_seconds, retry_delay
+
+MAX_CONNECTIONS = 20           # Maximum in-flight requests overall
+RETRIES = 3
+RETRY_DELAY_SECONDS = 2        # Doubled after each failed attempt (with jitter)
+TIMEOUT_SECONDS = 30
+QUEUE_SIZE = 16                # Retrieved pages waiting to be processed (see iter_retrieve_urls)
+STOP_POLL_SECONDS = 0.5        # How often iter_retrieve_urls' fetching checks whether it has been stopped
+
+
+def _page_text(url, response, cache):
+    if cache is None:
+        response.raise_for_status()
+        return response.text
+    return cache.update(url, response)
+
+
+def _retry_wait(throttle, url, response, latency, attempt, retries, retry_delay_seconds):
+    """
+    Release the throttle slot for a request (and count it in the run metrics) and return
+    how long to wait before retrying it, or None if it should not be retried (succeeded,
+    or out of retries)
+    """
+    METRICS.add(url, requests=1, bytes=0 if response is None else response.num_bytes_downloaded)
+    status_code = None if response is None else response.status_code
+    retry_after = None if response is None else retry_after_seconds(response)
+    throttle.release(status_code, latency, retry_after)
+    if status_code is not None and status_code not in RETRY_STATUS_CODES:
+        return None
+    if attempt == retries:
+        return None
+    return retry_delay(attempt, retry_delay_seconds, retry_after)
+
+
+async def async_retrieve_url(client, url, retries=RETRIES, retry_delay_seconds=RETRY_DELAY_SECONDS, cache=None):
+    """
+    Retrieve a single URL using the shared client, waiting for the host's throttle
+    and retrying with backoff on failure.
+    If an HttpCache is given the request is a conditional GET
+    """
+    throttle = host_throttle(url)
+    headers = await asyncio.to_thread(cache.conditional_headers, url) if cache is not None else None
+    for attempt in range(retries + 1):
+        await throttle.acquire_async()
+        start = time.perf_counter()
+        try:
+            request = client.build_request("GET", url, headers=headers)
+            request.extensions["trace"] = METRICS.async_trace(url)
+            r = await client.send(request)
+        except httpx.TransportError:
+            wait = _retry_wait(throttle, url, None, None, attempt, retries, retry_delay_seconds)
+            if wait is None:
+                raise
+        except BaseException:
+            throttle.cancel()
+            raise
+        else:
+            wait = _retry_wait(throttle, url, r, time.perf_counter() - start, attempt, retries, retry_delay_seconds)
+            if wait is None:
+                return _page_text(url, r, None) if cache is None else await asyncio.to_thread(_page_text, url, r, cache)
+        await asyncio.sleep(wait)
+
+
+def retrieve_url_throttled(url, retries=RETRIES, retry_delay_seconds=RETRY_DELAY_SECONDS, cache=None):
+    """
+    Synchronous version of async_retrieve_url (for a single page, e.g. from a task),
+    sharing the same host throttle
+    """
+    throttle = host_throttle(url)
+    headers = cache.conditional_headers(url) if cache is not None else None
+    with httpx.Client(timeout=TIMEOUT_SECONDS) as client:
+        for attempt in range(retries + 1):
+            throttle.acquire()
+            start = time.perf_counter()
+            try:
+                request = client.build_request("GET", url, headers=headers)
+                request.extensions["trace"] = METRICS.trace(url)
+                r = client.send(request)
+            except httpx.TransportError:
+                wait = _retry_wait(throttle, url, None, None, attempt, retries, retry_delay_seconds)
+                if wait is None:
+                    raise
+            except BaseException:
+                throttle.cancel()
+                raise
+            else:
+                wait = _retry_wait(throttle, url, r, time.perf_counter() - start, attempt, retries, retry_delay_seconds)
+                if wait is None:
+                    return _page_text(url, r, cache)
+            time.sleep(wait)
+
+
+def async_client(max_connections=MAX_CONNECTIONS):
+    """
+    The pooled client shared by all the requests of a batch (see async_retrieve_url)
+    """
+    limits = httpx.Limits(max_connections=max_connections,
+                          max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(limits=limits, timeout=TIMEOUT_SECONDS)
+
+
+async def async_retrieve_urls(urls: List[str],
+                              max_connections=MAX_CONNECTIONS,
+                              retries=RETRIES,
+                              retry_delay_seconds=RETRY_DELAY_SECONDS,
+                              cache=None,
+                              return_exceptions=False) -> List[Union[str, Exception]]:
+    """
+    Retrieve all URLs concurrently and return the html for each, in the same order as `urls`.
+    If a URL could not be retrieved its exception is raised, or with return_exceptions
+    is returned in its place (and the other URLs are still retrieved)
+    """
+    async with async_client(max_connections) as client:
+        return await asyncio.gather(*[
+            async_retrieve_url(client, url, retries, retry_delay_seconds, cache)
+            for url in urls
+        ], return_exceptions=return_exceptions)
+
+
+def retrieve_urls(urls: List[str], **kwargs) -> List[Union[str, Exception]]:
+    """
+    Synchronous entry point to async_retrieve_urls (for use from sync flows and tasks)
+    """
+    return asyncio.run(async_retrieve_urls(urls, **kwargs))
+
+
+def iter_retrieve_urls(urls: List[str], queue_size=QUEUE_SIZE,
+                       max_connections=MAX_CONNECTIONS,
+                       retries=RETRIES,
+                       retry_delay_seconds=RETRY_DELAY_SECONDS,
+                       cache=None) -> Iterator[Tuple[str, Union[str, Exception]]]:
+    """
+    Yields (url, html) for each URL as soon as it has been retrieved (so not in input order),
+    or (url, exception) if it could not be retrieved.
+    The pages are fetched concurrently in a background thread, which stops fetching
+    (backpressure) while queue_size pages are waiting to be processed.
+    If the iteration stops early (the generator is closed, or the loop over it raises),
+    the fetching is cancelled and the thread exits
+    """
+    results = queue.Queue(maxsize=queue_size)
+    finished = object()
+    stop = threading.Event()
+
+    def put(item):
+        # Wait for room in the queue, unless the consumer has gone
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=STOP_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    async def fetch_all():
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(max_connections)   # So no more than this is held outside the queue
+
+        async def fetch(client, url):
+            async with in_flight:
+                try:
+                    html = await async_retrieve_url(client, url, retries, retry_delay_seconds, cache)
+                except Exception as e:
+                    html = e
+                await loop.run_in_executor(None, put, (url, html))
+
+        async with async_client(max_connections) as client:
+            fetches = asyncio.gather(*[fetch(client, url) for url in urls])
+            while not fetches.done():
+                await asyncio.wait([fetches], timeout=STOP_POLL_SECONDS)
+                if stop.is_set():
+                    fetches.cancel()
+                    await asyncio.gather(fetches, return_exceptions=True)
+
+    def run():
+        try:
+            asyncio.run(fetch_all())
+        finally:
+            put(finished)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while (item := results.get()) is not finished:
+            yield item
+    finally:
+        stop.set()
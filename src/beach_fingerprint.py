@@ -0,0 +1,70 @@
+# Content fingerprints for detecting beaches whose data has not changed
+#
+# Two hashes are stored with each row of daily data (see BEACH_TABLE_SCHEMA):
+#   "Page hash"   - of the beach page html, without the parts that change on every
+#                   request (the "Data last updated NN minutes ago" panel)
+#   "Record hash" - of the extracted values, again without "Data last updated"
+# If a page's hash matches the latest stored row for the beach it is not parsed, and
+# if the extracted record's hash matches, the beach is not written again.
+# The hashes used for the comparison are kept in their own table, which is only
+# updated once every sink has written the rows (see store_fingerprints): if a sink
+# fails, the beaches are not skipped next time, so that sink is written again.
+
+import hashlib
+import json
+import re
+
+import pendulum
+
+from beach_sqlite import BEACH_TABLE
+
+FINGERPRINT_TABLE = "beach_fingerprints"
+
+VOLATILE_FIELDS = {"beach-timelapse-panel"}   # Class names of the fields that change on every request
+VOLATILE_HTML = re.compile(
+    r'(<(?:div|span)\b[^>]*\bclass="[^"]*\b(?:' + "|".join(VOLATILE_FIELDS) + r')\b[^"]*"[^>]*>)[^<]*')
+
+
+def page_fingerprint(beachmapp_html):
+    return hashlib.sha256(VOLATILE_HTML.sub(r"\1", beachmapp_html).encode()).hexdigest()
+
+
+def record_fingerprint(record, beachwatch_fields):
+    """
+    Hash of the extracted values (as from scrape_beach_values) in beachwatch_fields order
+    """
+    values = [value for classname, value in zip(beachwatch_fields, record) if classname not in VOLATILE_FIELDS]
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def store_fingerprints(db, all_daily_data_df):
+    """
+    Record the hashes of the rows, once they have been written to every sink
+    """
+    if not db[FINGERPRINT_TABLE].exists():
+        db[FINGERPRINT_TABLE].create({"Beach URL": str, "Page hash": str, "Record hash": str, "Stored": str},
+                                     pk="Beach URL")
+    stored = pendulum.now("UTC").isoformat()
+    with db.conn:
+        db.conn.executemany(
+            f'INSERT OR REPLACE INTO "{FINGERPRINT_TABLE}" ("Beach URL", "Page hash", "Record hash", "Stored") '
+            f"VALUES (?, ?, ?, ?)",
+            [(beach_url, page_hash, record_hash, stored) for beach_url, page_hash, record_hash in zip(
+                all_daily_data_df["Beach URL"], all_daily_data_df["Page hash"], all_daily_data_df["Record hash"])])
+
+
+def stored_fingerprints(db):
+    """
+    Returns {beach URL: (page hash, record hash)} as last written to every sink, for each
+    beach whose latest row in the beach table still has that record hash
+    """
+    if not db[FINGERPRINT_TABLE].exists() or not db[BEACH_TABLE].exists():
+        return {}
+    return {
+        beach_url: (page_hash, record_hash)
+        for beach_url, page_hash, record_hash in db.execute(
+            f'SELECT "Beach URL", "Page hash", "Record hash" FROM "{FINGERPRINT_TABLE}" AS f '
+            f'WHERE EXISTS (SELECT 1 FROM "{BEACH_TABLE}" AS t '
+            f'WHERE t."Beach URL" = f."Beach URL" AND t."Record hash" = f."Record hash" '
+            f'AND t."Data date" = (SELECT MAX("Data date") FROM "{BEACH_TABLE}" WHERE "Beach URL" = f."Beach URL"))')
+    }
@@ -0,0 +1,79 @@
+# Freshness check: has Beachmapp been updated since the data was last stored?
+#
+# The pages are only updated once a day, but the job may run more often (e.g. hourly),
+# so before scraping all the beaches a small sample of pages is fetched and their
+# "Data last updated NN minutes ago" converted to an absolute time. If none of them
+# is later than the latest update already stored in the SQLite table, there is
+# nothing new to scrape or write. If any sampled page cannot be retrieved, whether
+# there is new data is unknown and the beaches are scraped anyway.
+
+import pandas as pd
+
+from beach_extract import extract_beach_data
+from beach_fetch import retrieve_urls
+from beach_normalise import LAST_UPDATED_PATTERN, UNIT_MINUTES, last_updated_time
+from beach_sqlite import BEACH_TABLE
+
+FRESHNESS_SAMPLE_SIZE = 5
+LAST_UPDATED_FIELD = {"beach-timelapse-panel": "Data last updated"}
+
+
+def sample_beaches(beaches_url_list, n=FRESHNESS_SAMPLE_SIZE):
+    """
+    n beach URLs spread evenly through the list (so across the regions)
+    """
+    step = max(len(beaches_url_list) // n, 1)
+    return [beach_url for _, beach_url in beaches_url_list[::step][:n]]
+
+
+def sampled_last_updated(beach_urls):
+    """
+    Fetch the pages and return the "Data last updated" text and (UTC) time for each,
+    along with the resolution of the text (e.g. "3 hours ago" is only accurate to the hour).
+    Pages that could not be retrieved have Retrieved False and no time
+    """
+    # Not from the HTTP cache, as the text is relative to when it is fetched
+    pages = retrieve_urls(beach_urls, return_exceptions=True)
+    ok = [not isinstance(html, Exception) for html in pages]
+    retrieved = pd.Series(pd.Timestamp.now(tz="UTC"), index=range(len(pages)))
+    text = pd.Series([extract_beach_data(html, LAST_UPDATED_FIELD)[0][0] if page_ok else None
+                      for html, page_ok in zip(pages, ok)], dtype="string")
+    unit = text.str.extract(LAST_UPDATED_PATTERN)[1].str.lower()
+    return pd.DataFrame({
+        "Beach URL": beach_urls,
+        "Retrieved": ok,
+        "Data last updated": last_updated_time(retrieved, text),
+        "Resolution": pd.to_timedelta(unit.map(UNIT_MINUTES).astype(float), unit="m"),
+    })
+
+
+def latest_stored_update(db):
+    """
+    The latest "Data last updated" time in the beach table, or None if there is none
+    """
+    if not db[BEACH_TABLE].exists():
+        return None
+    latest = db.execute(f'SELECT MAX("Data last updated") FROM "{BEACH_TABLE}"').fetchone()[0]
+    return pd.Timestamp(latest).tz_convert("UTC") if latest else None
+
+
+def check_freshness(beaches_url_list, db, n=FRESHNESS_SAMPLE_SIZE):
+    """
+    Returns (True if there is new data to scrape, message describing why)
+    """
+    sample = sampled_last_updated(sample_beaches(beaches_url_list, n))
+    stored = latest_stored_update(db)
+    if stored is None:
+        return True, "No stored data"
+    if not sample["Retrieved"].all():
+        return True, f"Could not retrieve {(~sample['Retrieved']).sum()} of {len(sample)} sampled beaches"
+    if sample["Data last updated"].isna().all():
+        return True, f"Could not read the last updated time from {len(sample)} sampled beaches"
+
+    # The earliest time the newest sampled update could have been, given the text's resolution
+    newest = (sample["Data last updated"] - sample["Resolution"]).max()
+    updated = sample["Data last updated"].max()
+    if newest > stored:
+        return True, f"New data: sampled beaches updated at {updated:%Y-%m-%d %H:%M} UTC (stored {stored:%Y-%m-%d %H:%M} UTC)"
+    return False, (f"No new data: {len(sample)} sampled beaches last updated at {updated:%Y-%m-%d %H:%M} UTC, "
+                   f"already stored ({stored:%Y-%m-%d %H:%M} UTC)")
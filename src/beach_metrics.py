@@ -0,0 +1,171 @@
+# Performance metrics for a run of the beach job
+#
+# Per page (URL) - mostly beach pages, but also the catalogue pages:
+#   connect_seconds  - opening the TCP connection, including the DNS lookup (0 if a pooled connection was re-used)
+#   tls_seconds      - the TLS handshake (also 0 for a re-used connection)
+#   ttfb_seconds     - from sending the request to receiving the response headers
+#   download_seconds - receiving the response body
+#   bytes            - bytes received (as sent, i.e. before decompression)
+#   requests         - requests made (more than 1 if retried); the timings are summed over them
+#   parse_seconds    - extracting the data from the page
+# The request timings come from the httpcore "trace" extension (see trace).
+#
+# Per stage (e.g. "catalogue", "scrape", "write sqlite"): the time spent, summed over the run.
+#
+# At the end of the run the metrics are logged as a summary table and written to
+# METRICS_PATH as JSON (.json) and in the Prometheus text format (.prom, e.g. for
+# the node exporter's textfile collector).
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+METRICS_PATH = "data/run_metrics"
+BEACH_METRICS = ["connect_seconds", "tls_seconds", "ttfb_seconds", "download_seconds", "bytes", "requests",
+                 "parse_seconds"]
+TRACE_METRICS = {
+    "connect_tcp": "connect_seconds",
+    "start_tls": "tls_seconds",
+    "receive_response_body": "download_seconds",
+}
+PROMETHEUS_PREFIX = "beach_job"
+
+
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.beaches = {}
+            self.stages = {}
+
+    def add(self, url, **values):
+        """
+        Add to the metrics for a page, e.g. add(url, parse_seconds=0.01)
+        """
+        with self.lock:
+            beach = self.beaches.setdefault(url, dict.fromkeys(BEACH_METRICS, 0))
+            for name, value in values.items():
+                beach[name] += value
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def trace(self, url):
+        """
+        A callback for the httpcore "trace" request extension, recording the connection,
+        TLS, time to first byte and download times for url. For an httpx.AsyncClient,
+        use async_trace
+        """
+        started = {}
+
+        def on_event(event, info):
+            name, _, phase = event.rpartition(".")
+            name = name.split(".", 1)[-1]   # e.g. "http11.receive_response_headers" -> "receive_response_headers"
+            now = time.perf_counter()
+            if phase == "started":
+                started[name] = now
+            elif phase == "complete" and name in started:
+                if name in TRACE_METRICS:
+                    self.add(url, **{TRACE_METRICS[name]: now - started[name]})
+                elif name == "receive_response_headers" and "send_request_headers" in started:
+                    self.add(url, ttfb_seconds=now - started["send_request_headers"])
+
+        return on_event
+
+    def async_trace(self, url):
+        on_event = self.trace(url)
+
+        async def on_event_async(event, info):
+            on_event(event, info)
+
+        return on_event_async
+
+    def beaches_df(self) -> pd.DataFrame:
+        with self.lock:
+            return pd.DataFrame.from_dict(self.beaches, orient="index", columns=BEACH_METRICS).rename_axis("url")
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Total, mean, median, 95th percentile and maximum of each per page metric
+        """
+        beaches = self.beaches_df()
+        return pd.DataFrame({
+            "total": beaches.sum(),
+            "mean": beaches.mean(),
+            "p50": beaches.quantile(0.5),
+            "p95": beaches.quantile(0.95),
+            "max": beaches.max(),
+        })
+
+    def summary_table(self) -> str:
+        with self.lock:
+            stages = dict(self.stages)
+        lines = [f"{len(self.beaches)} pages, {time.time() - self.started:.1f}s since start of run", "",
+                 self.summary().round(4).to_string(), "", "Stage seconds:"]
+        lines += [f"  {name:<32}{seconds:>9.3f}" for name, seconds in stages.items()]
+        return "\n".join(lines)
+
+    def to_json(self):
+        with self.lock:
+            stages = dict(self.stages)
+        return {
+            "started": self.started,
+            "stages": stages,
+            "summary": json.loads(self.summary().to_json()),
+            "beaches": json.loads(self.beaches_df().to_json(orient="index")),
+        }
+
+    def to_prometheus(self) -> str:
+        with self.lock:
+            stages = dict(self.stages)
+        beaches = self.beaches_df()
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent in each stage of the last run",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge"]
+        lines += [f'{PROMETHEUS_PREFIX}_stage_seconds{{stage="{name}"}} {seconds:.6f}' for name, seconds in stages.items()]
+        for metric in BEACH_METRICS:
+            name = f"{PROMETHEUS_PREFIX}_page_{metric}"
+            values = beaches[metric]
+            lines += [f"# HELP {name} Per page {metric.replace('_', ' ')} in the last run",
+                      f"# TYPE {name} summary"]
+            lines += [f'{name}{{quantile="{q}"}} {values.quantile(q) if len(values) else 0:.6f}' for q in (0.5, 0.95)]
+            lines += [f"{name}_sum {values.sum():.6f}", f"{name}_count {len(values)}"]
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_last_run_timestamp_seconds Start time of the last run",
+                  f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+                  f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds {self.started:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_PATH):
+        """
+        Write the metrics to <path>.json and <path>.prom. Returns the paths written
+        """
+        written = []
+        for suffix, text in [(".json", json.dumps(self.to_json(), indent=1)), (".prom", self.to_prometheus())]:
+            # Write then rename, so a reader (e.g. the textfile collector) never sees a partial file
+            target = Path(f"{path}{suffix}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_suffix(f"{suffix}.tmp")
+            tmp_path.write_text(text)
+            os.replace(tmp_path, target)
+            written.append(target)
+        return written
+
+
+METRICS = RunMetrics()
@@ -0,0 +1,114 @@
+# Normalise the scraped daily beach data into typed columns
+#
+# The scraped values are all strings (e.g. "19°", "2.4mm", "1.62m 10:45am",
+# "Data last updated 25 minutes ago"). These are converted once, with vectorised
+# pandas string operations, into:
+#   - float32 columns for temperatures (°C), rainfall (mm) and tide heights (m)
+#   - datetime columns (UTC) for when the data was retrieved and last updated,
+#     plus the times of the high and low tides ("High tide time", "Low tide time")
+#   - categorical columns for the repetitive text fields
+# A field that was missing from the page (i.e. has the class name placeholder) becomes NA.
+
+import pandas as pd
+
+LOCAL_TIMEZONE = "Australia/Sydney"
+
+NUMBER_PATTERN = r"(-?\d+(?:\.\d+)?)"
+TIDE_HEIGHT_PATTERN = r"(\d+(?:\.\d+)?)\s*m\b"
+TIME_PATTERN = r"(?i)(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m"
+LAST_UPDATED_PATTERN = r"(?i)(\d+|an?)\s+(second|minute|hour|day)s?\s+ago"
+
+UNIT_MINUTES = {"second": 1 / 60, "minute": 1, "hour": 60, "day": 24 * 60}
+
+NUMERIC_COLUMNS = ["Maximum forecast air temperature", "Water temperature", "Rainfall"]
+TIDE_COLUMNS = ["High tide", "Low tide"]
+CATEGORY_COLUMNS = ["Region", "Pollution status", "Weather forecast", "Swell", "Wind", "Patrol info"]
+DATETIME_COLUMNS = ["Retrieved", "Data last updated", "High tide time", "Low tide time"]
+
+
+def _without_placeholders(df, beachwatch_fields):
+    """
+    Replace the class name placeholder (used when a field is missing from the page) with NA
+    """
+    df = df.copy()
+    for classname, item_name in beachwatch_fields.items():
+        if item_name in df.columns:
+            values = df[item_name].astype("string")
+            placeholders = {classname, " ".join(classname)}   # Alerts are joined character by character
+            df[item_name] = values.mask(values.isin(placeholders) | (values.str.strip() == ""), pd.NA)
+    return df
+
+
+def last_updated_time(retrieved, last_updated_text):
+    """
+    Convert "Data last updated NN minutes ago" into an absolute (UTC) time,
+    relative to when the page was retrieved
+    """
+    parts = last_updated_text.str.extract(LAST_UPDATED_PATTERN)
+    count = pd.to_numeric(parts[0].str.lower().replace({"a": "1", "an": "1"}), errors="coerce").astype(float)
+    minutes = count * parts[1].str.lower().map(UNIT_MINUTES).astype(float)
+    return (retrieved - pd.to_timedelta(minutes, unit="m")).dt.floor("min")
+
+
+def time_of_day(retrieved, text):
+    """
+    Convert a time of day such as "10:45am" into an absolute (UTC) time
+    on the (Sydney) date the page was retrieved
+    """
+    parts = text.str.extract(TIME_PATTERN)
+    pm = (parts[2].str.lower() == "p").fillna(False).astype(int)
+    hours = pd.to_numeric(parts[0], errors="coerce").astype(float) % 12 + 12 * pm
+    minutes = hours * 60 + pd.to_numeric(parts[1], errors="coerce").astype(float).fillna(0)
+    local_date = retrieved.dt.tz_convert(LOCAL_TIMEZONE).dt.normalize()
+    return (local_date + pd.to_timedelta(minutes, unit="m")).dt.tz_convert("UTC")
+
+
+def normalise_daily_beach_data(all_daily_data_df, beachwatch_fields) -> pd.DataFrame:
+    """
+    Returns the typed version of the scraped daily beach data
+    """
+    df = _without_placeholders(all_daily_data_df, beachwatch_fields)
+    # Parse each ISO timestamp individually as the format varies (microseconds are omitted when zero)
+    retrieved = pd.to_datetime(df["Retrieved"].map(pd.Timestamp), utc=True)
+    df["Retrieved"] = retrieved
+
+    if "Data last updated" in df.columns:
+        df["Data last updated"] = last_updated_time(retrieved, df["Data last updated"])
+
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns:
+            number = df[column].str.extract(NUMBER_PATTERN, expand=False)
+            df[column] = pd.to_numeric(number, errors="coerce").astype("float32")
+
+    for column in TIDE_COLUMNS:
+        if column in df.columns:
+            height = df[column].str.extract(TIDE_HEIGHT_PATTERN, expand=False)
+            tide_time = time_of_day(retrieved, df[column])
+            df[column] = pd.to_numeric(height, errors="coerce").astype("float32")
+            df.insert(df.columns.get_loc(column) + 1, f"{column} time", tide_time)
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+
+    return df
+
+
+def data_date(df) -> pd.Series:
+    """
+    The (Sydney) date that each row's data is for: the date it was last updated,
+    or else the date it was retrieved, as "YYYY-MM-DD"
+    """
+    when = df["Data last updated"].fillna(df["Retrieved"]) if "Data last updated" in df.columns else df["Retrieved"]
+    return when.dt.tz_convert(LOCAL_TIMEZONE).dt.strftime("%Y-%m-%d")
+
+
+def without_timezones(df) -> pd.DataFrame:
+    """
+    Copy of df with timezone-aware columns converted to (naive) Sydney time,
+    for outputs such as Excel that do not support timezones
+    """
+    df = df.copy()
+    for column in df.select_dtypes(include="datetimetz").columns:
+        df[column] = df[column].dt.tz_convert(LOCAL_TIMEZONE).dt.tz_localize(None)
+    return df
@@ -0,0 +1,91 @@
+# Parsing beach pages in a pool of worker processes
+#
+# Parsing is CPU bound (and holds the GIL), so the pages are parsed in separate
+# processes. Only plain data crosses between processes: each worker is sent the
+# page as (utf-8) bytes and returns the values as a tuple of strings (a tuple of
+# strings for a multi-value field such as the alerts), so no parse tree is ever
+# pickled. With one worker (e.g. on a single core) the pages are parsed in-process.
+# From async code, ParsePool.parse awaits a page's result without blocking the event loop.
+#
+# Workers are spawned rather than forked, as the flows' process has other threads
+# (the fetcher, Prefect's) running.
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from beach_extract import PARSER_BACKEND, extraction_plan
+
+PARSE_WORKERS = os.cpu_count() or 1
+
+
+def parse_page(page, plan, backend=PARSER_BACKEND):
+    """
+    Parse a page given as bytes. Returns (values, seconds taken to parse), with values
+    a tuple of strings in the order of the plan's fields (see beach_extract.ExtractionPlan)
+    """
+    start = time.perf_counter()
+    beach_data = plan.extract(page.decode(), backend)
+    values = tuple(tuple(value) if isinstance(value, list) else value for value, _ in beach_data)
+    return values, time.perf_counter() - start
+
+
+class ParsePool:
+    def __init__(self, beachwatch_fields, max_workers=PARSE_WORKERS, backend=PARSER_BACKEND):
+        self.plan = extraction_plan(beachwatch_fields)   # Compiled once, not for every page
+        self.backend = backend
+        self.executor = None
+        if max_workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.pending = {}    # future -> key
+        self.finished = []   # (key, result) parsed in-process but not yet returned
+
+    def submit(self, key, beachmapp_html):
+        """
+        Start parsing a page. key (e.g. the beach URL) is returned with its result
+        """
+        page = beachmapp_html.encode()
+        if self.executor is None:
+            self.finished.append((key, parse_page(page, self.plan, self.backend)))
+        else:
+            self.pending[self.executor.submit(parse_page, page, self.plan, self.backend)] = key
+
+    async def parse(self, beachmapp_html):
+        """
+        Parse a page without blocking the event loop: returns (values, seconds) once a worker
+        process has parsed it, or with one worker once a thread has (which keeps the loop free
+        for I/O, but as parsing holds the GIL does not parse in parallel)
+        """
+        page = beachmapp_html.encode()
+        if self.executor is None:
+            return await asyncio.to_thread(parse_page, page, self.plan, self.backend)
+        return await asyncio.wrap_future(self.executor.submit(parse_page, page, self.plan, self.backend))
+
+    def done(self):
+        """
+        (key, (values, seconds)) for each page parsed since the last call, without waiting
+        """
+        finished, self.finished = self.finished, []
+        for future in [future for future in self.pending if future.done()]:
+            finished.append((self.pending.pop(future), future.result()))
+        return finished
+
+    def results(self):
+        """
+        Yields (key, (values, seconds)) for every page not yet returned, as each is parsed
+        """
+        yield from self.done()
+        for future in as_completed(list(self.pending)):
+            yield self.pending.pop(future), future.result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,105 @@
+# Publishing the beach database to S3 without re-uploading all of history every run
+#
+# PUBLISH_MODE:
+#   "delta" - upload only the day(s) written by this run, as one parquet file per day
+#             (daily/date=YYYY-MM-DD/beach_daily.parquet), and update a manifest
+#             (daily/manifest.json) listing every day with its key, row count and hash.
+#             A day's file is not re-uploaded if its content hash is unchanged.
+#   "full"  - upload the whole SQLite file, but only if its content hash has changed
+#             since the last upload (recorded in PUBLISH_STATE_PATH)
+
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pendulum
+
+from beach_sqlite import BEACH_TABLE
+from scaleway_s3_storage import read_json_s3, upload_file_to_s3, write_json_s3
+
+PUBLISH_MODE = "delta"
+PUBLISH_STATE_PATH = "data/publish_state.json"
+DAILY_PREFIX = "daily"
+MANIFEST_KEY = f"{DAILY_PREFIX}/manifest.json"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _read_state(state_path):
+    try:
+        return json.loads(Path(state_path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state, state_path):
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, indent=1))
+    os.replace(tmp_path, state_path)
+
+
+def publish_sqlite_if_changed(s3, db_path, bucket_name, object_name=None, state_path=PUBLISH_STATE_PATH):
+    """
+    Upload the SQLite file unless it is unchanged since the last upload.
+    Returns True if it was uploaded
+    """
+    object_name = object_name or os.path.basename(db_path)
+    state = _read_state(state_path)
+    state_key = f"s3://{bucket_name}/{object_name}"
+    sha = file_sha256(db_path)
+    if state.get(state_key) == sha:
+        print(f"Skipped upload of {db_path}: unchanged since last upload")
+        return False
+    if not upload_file_to_s3(s3, db_path, bucket_name, object_name):
+        return False
+    state[state_key] = sha
+    _write_state(state, state_path)
+    print(f"Uploaded {db_path} to {state_key}")
+    return True
+
+
+def publish_daily_partitions(s3, db, bucket_name, data_dates):
+    """
+    Upload the rows for each of the given days (from the SQLite table) as one parquet file
+    per day and update the manifest. Returns the list of days uploaded
+    """
+    manifest = read_json_s3(s3, bucket_name, MANIFEST_KEY, default={"days": {}})
+    uploaded = []
+    for day in sorted(set(data_dates)):
+        day_df = pd.read_sql(f'SELECT * FROM "{BEACH_TABLE}" WHERE "Data date" = ? ORDER BY "Beach URL"',
+                             db.conn, params=[day])
+        with io.BytesIO() as parquet_buffer:
+            day_df.to_parquet(parquet_buffer, index=False)
+            body = parquet_buffer.getvalue()
+        sha = hashlib.sha256(body).hexdigest()
+        if manifest["days"].get(day, {}).get("sha256") == sha:
+            continue
+        key = f"{DAILY_PREFIX}/date={day}/{BEACH_TABLE}.parquet"
+        s3.put_object(Bucket=bucket_name, Key=key, Body=body)
+        manifest["days"][day] = {
+            "key": key,
+            "rows": len(day_df),
+            "bytes": len(body),
+            "sha256": sha,
+            "updated": pendulum.now("UTC").isoformat(),
+        }
+        uploaded.append(day)
+
+    if uploaded:
+        manifest["updated"] = pendulum.now("UTC").isoformat()
+        write_json_s3(s3, manifest, bucket_name, MANIFEST_KEY)
+        print(f"Uploaded {', '.join(uploaded)} to s3://{bucket_name}/{DAILY_PREFIX}/ and updated {MANIFEST_KEY}")
+    else:
+        print(f"Skipped upload to s3://{bucket_name}/{DAILY_PREFIX}/: unchanged since last upload")
+    return uploaded
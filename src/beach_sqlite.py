@@ -0,0 +1,181 @@
+# SQLite storage for the (normalised) daily beach data
+#
+# One row per beach per day: the table has an explicit schema with a primary key
+# on (Beach URL, Data date), so re-running the job (e.g. hourly, or a retry)
+# updates that day's row rather than appending a duplicate. Queries by region,
+# beach or date use indexes, and the database is in WAL mode so readers are not
+# blocked while the job writes. Columns of the data that are not in BEACH_TABLE_SCHEMA
+# (e.g. a field added to BEACHWATCH_FIELDS) are added to the table when first written.
+#
+# Before this table, the job appended each run's scraped strings to a "beaches" table
+# (LEGACY_TABLE). When the database is opened, any rows there are normalised and copied
+# into the beach table, once: the legacy table is then renamed to MIGRATED_LEGACY_TABLE.
+
+import pandas as pd
+from sqlite_utils import Database
+
+from beach_normalise import CATEGORY_COLUMNS, DATETIME_COLUMNS, data_date, normalise_daily_beach_data
+from site_spec import BEACHMAPP_BASE_URL, BEACHWATCH_FIELDS
+
+SQLITE_DB_PATH = "data/daily_beach_data_db.sqlite"
+BEACH_TABLE = "beach_daily"
+BEACH_TABLE_PK = ("Beach URL", "Data date")
+LEGACY_TABLE = "beaches"
+MIGRATED_LEGACY_TABLE = "beaches_legacy"
+FLOAT_DECIMALS = 4   # float32 values are rounded when stored (as SQLite REAL is a double)
+
+BEACH_TABLE_SCHEMA = {
+    "Beach URL": str,
+    "Data date": str,
+    "Retrieved": str,
+    "Region": str,
+    "Beach name": str,
+    "Data last updated": str,
+    "Pollution status": str,
+    "Maximum forecast air temperature": float,
+    "Water temperature": float,
+    "Weather forecast": str,
+    "Swell": str,
+    "Wind": str,
+    "Patrol info": str,
+    "Rainfall": float,
+    "High tide": float,
+    "High tide time": str,
+    "Low tide": float,
+    "Low tide time": str,
+    "Alert": str,
+    "Page hash": str,     # See beach_fingerprint
+    "Record hash": str,
+}
+
+BEACH_TABLE_INDEXES = [["Region"], ["Beach name"], ["Data date"]]
+
+
+def open_beach_db(path=SQLITE_DB_PATH) -> Database:
+    """
+    Open (creating if necessary) the beach database, in WAL mode and with the beach table and indexes
+    """
+    db = Database(path)
+    db.enable_wal()
+    table = db[BEACH_TABLE]
+    if not table.exists():
+        table.create(BEACH_TABLE_SCHEMA, pk=BEACH_TABLE_PK)
+    add_missing_columns(db, BEACH_TABLE_SCHEMA)   # Columns added since the table was created
+    for columns in BEACH_TABLE_INDEXES:
+        table.create_index(columns, if_not_exists=True)
+    if db[LEGACY_TABLE].exists():
+        migrate_legacy_table(db)
+    return db
+
+
+def legacy_beach_url(beach_name):
+    """
+    The Beachmapp URL of a beach from its name (the legacy table has no URLs),
+    e.g. "Bondi Beach" -> .../beachmapp/Beach/Bondi-Beach
+    """
+    return f"{BEACHMAPP_BASE_URL}/Beach/{'-'.join(beach_name.split())}"
+
+
+def migrate_legacy_table(db):
+    """
+    Normalise the rows of the legacy table (scraped strings, appended every run, without
+    the beach URL) and write them to the beach table, oldest first so that the latest
+    retrieval of each beach and day is kept. Rows without a beach name are skipped.
+    The legacy table is then renamed (kept as it was), so this only happens once.
+    Returns the number of rows written
+    """
+    legacy_df = pd.read_sql(f'SELECT * FROM "{LEGACY_TABLE}"', db.conn).drop(columns="index", errors="ignore")
+    legacy_df = legacy_df.astype("string")
+    names = legacy_df["Beach name"].str.strip()
+    legacy_df = legacy_df[names.notna() & (names != "") & (names != "navbar-title-text")]
+    n_rows = 0
+    if not legacy_df.empty:
+        legacy_df.insert(2, "Beach URL", legacy_df["Beach name"].map(legacy_beach_url).astype("string"))
+        legacy_df = normalise_daily_beach_data(legacy_df.reset_index(drop=True), BEACHWATCH_FIELDS)
+        n_rows = upsert_daily_beach_data(db, legacy_df.sort_values("Retrieved", kind="stable"))
+    db.execute(f'ALTER TABLE "{LEGACY_TABLE}" RENAME TO "{MIGRATED_LEGACY_TABLE}"')
+    return n_rows
+
+
+def table_schema(all_daily_data_df):
+    """
+    BEACH_TABLE_SCHEMA plus the other columns of the DataFrame: float if numeric, else str
+    """
+    schema = dict(BEACH_TABLE_SCHEMA)
+    for column in all_daily_data_df.columns:
+        if column not in schema:
+            schema[column] = float if pd.api.types.is_numeric_dtype(all_daily_data_df[column]) else str
+    return schema
+
+
+def add_missing_columns(db, schema):
+    """
+    Add the columns of schema that the beach table does not have yet
+    """
+    table = db[BEACH_TABLE]
+    for column, column_type in schema.items():
+        if column not in table.columns_dict:
+            table.add_column(column, column_type)
+
+
+def sqlite_rows(all_daily_data_df, schema=BEACH_TABLE_SCHEMA):
+    """
+    Returns the rows of the DataFrame (in schema column order) as tuples of plain
+    Python values: ISO 8601 strings for datetimes and None for missing values
+    """
+    df = all_daily_data_df.assign(**{"Data date": data_date(all_daily_data_df)})
+    columns = {}
+    for column in schema:
+        values = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype="object")
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.map(lambda t: None if pd.isna(t) else t.isoformat())
+        elif schema[column] is float:
+            values = values.astype("float64").round(FLOAT_DECIMALS)
+        values = values.astype("object")
+        columns[column] = values.where(values.notna(), None)
+    return list(zip(*columns.values()))
+
+
+def latest_beach_rows(db, beach_urls) -> pd.DataFrame:
+    """
+    The latest stored row for each of the given beaches (that has one), with the
+    column types of the normalised daily data (see beach_normalise)
+    """
+    df = pd.read_sql(f'SELECT * FROM "{BEACH_TABLE}" AS t WHERE "Data date" = '
+                     f'(SELECT MAX("Data date") FROM "{BEACH_TABLE}" WHERE "Beach URL" = t."Beach URL")', db.conn)
+    df = df[df["Beach URL"].isin(set(beach_urls))].drop(columns="Data date").reset_index(drop=True)
+    column_types = db[BEACH_TABLE].columns_dict
+    for column in df.columns:
+        if column in DATETIME_COLUMNS:
+            # Parse each ISO timestamp individually as the format varies (microseconds are omitted when zero)
+            df[column] = pd.to_datetime(df[column].map(pd.Timestamp), utc=True)
+        elif column_types.get(column) is float:
+            df[column] = df[column].astype("float32")
+        elif column in CATEGORY_COLUMNS:
+            df[column] = df[column].astype("category")
+        else:
+            df[column] = df[column].astype("string")
+    return df
+
+
+def upsert_daily_beach_data(db, all_daily_data_df):
+    """
+    Insert or update (by Beach URL and Data date) all the rows in a single transaction,
+    first adding any of their columns that the table does not have.
+    Returns the number of rows written
+    """
+    schema = table_schema(all_daily_data_df)
+    add_missing_columns(db, schema)
+    rows = sqlite_rows(all_daily_data_df, schema)
+    column_names = ", ".join(f'"{column}"' for column in schema)
+    placeholders = ", ".join("?" for _ in schema)
+    updates = ", ".join(f'"{column}" = excluded."{column}"'
+                        for column in schema if column not in BEACH_TABLE_PK)
+    conflict_columns = ", ".join(f'"{column}"' for column in BEACH_TABLE_PK)
+    sql = (f'INSERT INTO "{BEACH_TABLE}" ({column_names}) VALUES ({placeholders}) '
+           f"ON CONFLICT ({conflict_columns}) DO UPDATE SET {updates}")
+    with db.conn:
+        db.conn.executemany(sql, rows)
+    # Copy the WAL into the main database file so the file itself is complete (e.g. for upload)
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return len(rows)
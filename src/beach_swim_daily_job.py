@@ -1,4 +1,3 @@
-
 # Retrieve daily beach data (Prefect)
 #
 # Automated daily job (in Prefect) that runs just after 7:30AM Sydney time 
@@ -9,63 +8,92 @@
 
 # from datetime import timedelta
 
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List
-import httpx
 import pandas as pd
 import pendulum
-from bs4 import BeautifulSoup
-from prefect import task, flow
+from prefect import task, flow, get_run_logger
+from prefect.orion.schemas.states import Completed
+from prefect.task_runners import ConcurrentTaskRunner, SequentialTaskRunner
+from prefect.utilities.annotations import unmapped
 #from prefect.deployments import DeploymentSpec
 #from prefect.orion.schemas.schedules import IntervalSchedule
-from sqlite_utils import Database
 
-from scaleway_s3_storage import connect_to_s3, dataframe_to_csv_s3, upload_file_to_s3
+from beach_archive import archive_page, archived_days, evict_archive, parse_archived_day
+from beach_catalogue import REFRESH_POLICY, catalogue_is_current, links_hash, load_catalogue, save_catalogue
+from beach_extract import PARSER_BACKEND, extract_beach_data, extraction_plan, page_links
+from beach_checkpoint import RunJournal, today
+from beach_dataset import DATASET_PATH, write_dataset_partitions
+from beach_fetch import iter_retrieve_urls, retrieve_url_throttled, retrieve_urls
+from beach_fingerprint import page_fingerprint, record_fingerprint, store_fingerprints, stored_fingerprints
+from beach_freshness import check_freshness
+from beach_metrics import METRICS
+from beach_normalise import CATEGORY_COLUMNS, data_date, normalise_daily_beach_data
+from beach_parse_pool import ParsePool
+from beach_sqlite import SQLITE_DB_PATH, latest_beach_rows, open_beach_db, upsert_daily_beach_data
+from beach_writers import SINK_DEPENDENCIES, enabled_sinks, run_writer
+from http_cache import HTTP_CACHE
+from site_spec import BEACHMAPP_BASE_URL, BEACHMAPP_SPEC, BEACHWATCH_FIELDS
+
+# The Beachmapp links to follow and the fields to extract are declared in site_spec
+# (BEACHMAPP_SPEC; BEACHWATCH_FIELDS are its field names). The fields are compiled here,
+# once, into the extraction plan used for every page (print(BEACHWATCH_PLAN) to see it -
+# see beach_extract); BEACHWATCH_FIELDS compiles to the same plan
+
+BEACHWATCH_PLAN = extraction_plan(BEACHMAPP_SPEC.fields)
 
-from sys import getrecursionlimit, setrecursionlimit
+# Task runner used by the flows that map fetch and parse tasks (see get_task_runner)
 
-# getrecursionlimit() is returning 1000 (default)
+TASK_RUNNER = "concurrent"   # "sequential", "concurrent" (threads) or "dask" (process pool)
+MAX_PARALLEL = 16            # Maximum number of beach pages being fetched at any one time
 
-RECURSION_LIMIT = 2000
-setrecursionlimit(RECURSION_LIMIT)
 
-# See: https://stackoverflow.com/questions/67986157/multiprocessing-how-to-debug-pickle-picklingerror-could-not-pickle-object-as
-#      Getting exception when recursion limit not set
+def get_task_runner(name=TASK_RUNNER, max_parallel=MAX_PARALLEL):
+    """
+    Returns the Prefect task runner for the mapped flows.
+    The "dask" runner gives a local process pool (of max_parallel workers) so that
+    CPU-bound parsing runs in parallel, but needs the optional prefect-dask package
+    """
+    if name == "sequential":
+        return SequentialTaskRunner()
+    if name == "dask":
+        from prefect_dask import DaskTaskRunner
+        return DaskTaskRunner(cluster_kwargs={"n_workers": max_parallel, "threads_per_worker": 1, "processes": True})
+    return ConcurrentTaskRunner()
+
 
-BEACHMAPP_BASE_URL = "https://www.environment.nsw.gov.au/beachmapp"
+USE_HTTP_CACHE = True   # Conditional GETs against the on-disk cache (see http_cache)
+CHECKPOINT_RUNS = True  # Record each beach in the run journal so a failed run can be resumed (see beach_checkpoint)
+SKIP_UNCHANGED = True   # Do not parse beaches whose content is unchanged; their stored rows are written instead (see beach_fingerprint)
+CHECK_FRESHNESS = True  # Skip the run if a sample of pages has not been updated since the stored data (see beach_freshness)
+ARCHIVE_PAGES = True    # Keep every beach page retrieved, compressed, so past days can be parsed again (see beach_archive)
 
-BEACHWATCH_FIELDS = {
-    "navbar-title-text": "Beach name",
-    "beach-timelapse-panel": "Data last updated",
-    "bw-status-text": "Pollution status",
-    "bw-air-temp-value": "Maximum forecast air temperature",
-    "bw-ocean-temp-value": "Water temperature",
-    "bw-weather-text": "Weather forecast",
-    "bw-swell": "Swell",
-    "bw-wind": "Wind",
-    "bw-patrol-info": "Patrol info",
-    "bw-rainfall": "Rainfall",
-    "bw-high-tide": "High tide",
-    "bw-low-tide": "Low tide",
-    "bw-alert-text": "Alert"
-}
 
-@task(retries=3, retry_delay_seconds=11)
+@task
 def retrieve_url(url):
-    with httpx.Client() as client:
-        r = client.get(url)
-        r.raise_for_status()
-    return r.text
+    """
+    Retrieve a page, through the host's rate limiter / circuit breaker and with
+    jittered retries (see beach_fetch and beach_throttle)
+    """
+    return retrieve_url_throttled(url, cache=HTTP_CACHE if USE_HTTP_CACHE else None)
 
-# TODO: See if this actually works instead of retrieve_url above
-#@task(retries=3, retry_delay_seconds=11)
-async def async_retrieve_url(url):
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url)
-        r.raise_for_status()
-    return r.text
+@task
+def retrieve_beach_pages(urls: List[str]) -> List[str]:
+    """
+    Retrieve all the beach pages concurrently (sharing one pooled client).
+    Retries are per URL (see beach_fetch), so a single slow or failing
+    page does not cause the whole batch to be re-fetched.
+    Returns the html for each URL in the same order as `urls`
+    """
+    return retrieve_urls(urls, cache=HTTP_CACHE if USE_HTTP_CACHE else None)
 
 
-# Define various helper functions to parse the html pages to extract the data for each beach
+# The original helper functions to parse the html pages to extract the data for each beach,
+# searching the page for each field in turn. No longer used by the flows (they use the
+# compiled BEACHWATCH_PLAN), but kept as the reference for the extraction benchmarks
 
 def get_beachwatch_data_for_class(beach_soup, classname, item_name):
     """
@@ -101,11 +129,166 @@ def scrape_beach_daily_data(beachmapp_html, beachwatch_fields):
     """
     Given a string of html representing a Beachmapp page,
     returns the daily data for that beach
+    (single pass over the page - see beach_extract)
+    """
+
+    return extract_beach_data(beachmapp_html, beachwatch_fields, PARSER_BACKEND)
+
+
+def cached_beach_values(beach_url, beachwatch_fields):
+    """
+    The values stored in the HTTP cache for a page that was unchanged (HTTP 304), or None
+    """
+    if USE_HTTP_CACHE:
+        record = HTTP_CACHE.cached_record(beach_url)
+        if record is not None and len(record) == len(beachwatch_fields):
+            return record
+    return None
+
+
+def scrape_beach_values(beach_url, beachmapp_html, beachwatch_fields):
+    """
+    Returns the list of values for a beach page as plain strings (or a list of
+    strings for the alerts) rather than BeautifulSoup objects.
+    If the page was unchanged (HTTP 304) the record stored in the HTTP cache is
+    re-used instead of parsing the page again
+    """
+    record = cached_beach_values(beach_url, beachwatch_fields)
+    if record is not None:
+        return record
+
+    start = time.perf_counter()
+    beach_data = scrape_beach_daily_data(beachmapp_html, beachwatch_fields)
+    METRICS.add(beach_url, parse_seconds=time.perf_counter() - start)
+    record = [
+        [str(x) for x in value] if isinstance(value, list) else str(value)
+        for (value, _) in beach_data
+    ]
+    if USE_HTTP_CACHE:
+        HTTP_CACHE.store_record(beach_url, record)
+    return record
+
+
+# scrape_beach_row is in three parts, so that the parsing in the middle can be done
+# elsewhere (see scrape_beach_rows): start_beach_row, parse, finish_beach_row
+
+def start_beach_row(region, beach_url, beachmapp_html, known=None):
+    """
+    Archive the page (with ARCHIVE_PAGES) and hash it. Returns (retrieved, page hash),
+    or None if the page is unchanged since the latest stored row
+    """
+    retrieved = pendulum.now().isoformat()
+    if ARCHIVE_PAGES:
+        with METRICS.stage("archive"):
+            archive_page(retrieved, region, beach_url, beachmapp_html)
+    page_hash = page_fingerprint(beachmapp_html)
+    if SKIP_UNCHANGED and known is not None and known[0] == page_hash:
+        return None
+    return retrieved, page_hash
+
+
+def finish_beach_row(region, beach_url, retrieved, page_hash, beach_values, beachwatch_fields, known=None):
+    """
+    The row of daily data for the parsed values, or None if they are unchanged since the latest stored row
+    """
+    record_hash = record_fingerprint(beach_values, beachwatch_fields)
+    if SKIP_UNCHANGED and known is not None and known[1] == record_hash:
+        return None
+    return [retrieved, region, beach_url] + beach_values + [page_hash, record_hash]
+
+
+def scrape_beach_row(region, beach_url, beachmapp_html, beachwatch_fields, known=None):
+    """
+    Returns the row of daily data for a beach page: [retrieved, region, beach URL] + values
+    + [page hash, record hash], or None if the beach is unchanged since the latest stored row
+    (whose page and record hashes are given as `known`).
+    The page is archived first (with ARCHIVE_PAGES), whether or not it has changed
+    """
+    started = start_beach_row(region, beach_url, beachmapp_html, known)
+    if started is None:
+        return None
+    beach_values = scrape_beach_values(beach_url, beachmapp_html, beachwatch_fields)
+    return finish_beach_row(region, beach_url, *started, beach_values, beachwatch_fields, known)
+
+
+def finish_parsed_row(region, beach_url, retrieved, page_hash, parsed, beachwatch_fields, known=None):
+    """
+    finish_beach_row for the (values, seconds) parsed by a ParsePool, storing the values in the HTTP cache
+    """
+    values, parse_seconds = parsed
+    METRICS.add(beach_url, parse_seconds=parse_seconds)
+    beach_values = [list(value) if isinstance(value, tuple) else value for value in values]
+    if USE_HTTP_CACHE:
+        HTTP_CACHE.store_record(beach_url, beach_values)
+    return finish_beach_row(region, beach_url, retrieved, page_hash, beach_values, beachwatch_fields, known)
+
+
+def scrape_beach_rows(pages, beachwatch_fields, known, pool):
+    """
+    scrape_beach_row for each (region, beach URL, html) in pages, with the parsing done by
+    the ParsePool's worker processes. Yields (beach URL, row or None if unchanged) for each
+    beach as soon as it is ready - so not in the order of pages - including while pages is
+    still being iterated
     """
+    def finish(key, result):
+        return key[1], finish_parsed_row(*key, result, beachwatch_fields, known.get(key[1]))
+
+    for region, beach_url, beachmapp_html in pages:
+        started = start_beach_row(region, beach_url, beachmapp_html, known.get(beach_url))
+        if started is None:
+            yield beach_url, None
+            continue
+        beach_values = cached_beach_values(beach_url, beachwatch_fields)
+        if beach_values is not None:
+            yield beach_url, finish_beach_row(region, beach_url, *started, beach_values, beachwatch_fields,
+                                              known.get(beach_url))
+        else:
+            pool.submit((region, beach_url) + started, beachmapp_html)
+        for key, result in pool.done():
+            yield finish(key, result)
+    for key, result in pool.results():
+        yield finish(key, result)
 
-    beach_soup = BeautifulSoup(beachmapp_html, "html.parser")
 
-    return get_all_data_for_beach(beach_soup, beachwatch_fields)
+def retrieved_pages(retrieved, regions, failed):
+    """
+    (region, beach URL, html) for each page from iter_retrieve_urls, logging (and adding
+    to the failed list) the beach URLs that could not be retrieved
+    """
+    for beach_url, beachmapp_html in retrieved:
+        if isinstance(beachmapp_html, Exception):
+            get_run_logger().error(f"Could not retrieve {beach_url}: {beachmapp_html}")
+            failed.append(beach_url)
+            continue
+        yield regions[beach_url], beach_url, beachmapp_html
+
+
+def evict_caches():
+    """
+    Trim the HTTP cache and the page archive (see HttpCache.evict and evict_archive)
+    """
+    HTTP_CACHE.evict()
+    removed = evict_archive()
+    if removed:
+        get_run_logger().info(f"Removed {len(removed)} days from the page archive ({removed[0]} to {removed[-1]})")
+
+
+def known_fingerprints(skip_unchanged=True):
+    """
+    {beach URL: (page hash, record hash)} of the latest stored rows
+    (empty unless SKIP_UNCHANGED and skip_unchanged, so that no beach is skipped)
+    """
+    return stored_fingerprints(open_beach_db(SQLITE_DB_PATH)) if SKIP_UNCHANGED and skip_unchanged else {}
+
+
+@task
+def parse_beach_page(region, beach_url, beachmapp_html, beachwatch_fields, known=None):
+    """
+    Parse a single beach page into a row of daily data (for the mapped flow), or None if unchanged.
+    Values are returned as plain strings (rather than BeautifulSoup objects)
+    so that results stay small when passed back from a worker process
+    """
+    return scrape_beach_row(region, beach_url, beachmapp_html, beachwatch_fields, known)
 
 
 @task
@@ -118,105 +301,580 @@ def create_beach_list(base_url, main_html, url_path, bypass):
     if bypass:
         return [base_url]
 
-    main_page = BeautifulSoup(main_html, "html.parser")
+    return page_links(base_url, main_html, url_path)
+
+@task
+def write_sink(sink, all_daily_data_df, run_time):
+    """
+    Run one output writer (see beach_writers), logging how long it took
+    """
+    logger = get_run_logger()
+    start = time.perf_counter()
+    try:
+        written = run_writer(sink, all_daily_data_df, run_time)
+    except Exception:
+        logger.error(f"Sink {sink}: failed after {time.perf_counter() - start:.2f}s")
+        raise
+    seconds = time.perf_counter() - start
+    METRICS.add_stage(f"write {sink}", seconds)
+    logger.info(f"Sink {sink}: wrote {written} in {seconds:.2f}s")
+    return seconds
 
-    return [
-        base_url.replace("/beachmapp", "") + link.get("href")
-        for link in main_page.find_all("a")
-        if url_path in link.get("href")
-    ]
 
 @flow(name="Write daily beach data")
-def write_daily_beach_data_local(all_daily_data_df, write_local=False):
-    if write_local is True:
-        data_filename = "data/all_beach_daily_data_"
-        data_parquet = data_filename.replace("data_", "data.parquet")
-        data_xlsx = data_filename + pendulum.now().isoformat() + ".xlsx"
-        data_csv = data_xlsx.replace(".xlsx", ".csv")
-        print(f"\nCreated: {data_csv}\n")
-
-        all_daily_data_df.to_parquet(data_parquet)
-        all_daily_data_df.to_excel(data_xlsx, index=False)
-        all_daily_data_df.to_csv(data_csv, index=False)
-    else:
-        bucket_name = "databooth-beach-swim"
-        data_filename = "all_beach_daily_data.csv"
-        s3 = connect_to_s3()
-        dataframe_to_csv_s3(s3, all_daily_data_df, bucket_name, data_filename)
-        print(f"\nWrote data to s3://{bucket_name}/{data_filename}\n")
-
-    # Write db locally in both cases
-    SQLITE_DB_PATH = "data/daily_beach_data_db.sqlite"
-    db = Database(SQLITE_DB_PATH)
-    all_daily_data_df.to_sql("beaches", con=db.conn, if_exists="append")
-    print(f"\nAlso wrote local SQLite DB: {SQLITE_DB_PATH}\n")
-
-    # Also upload SQLite DB to S3
-    s3 = connect_to_s3()
-    bucket_name = "databooth-beach-swim"
-    sqlite_filename = SQLITE_DB_PATH
-    if upload_file_to_s3(s3, sqlite_filename, bucket_name):
-        print(f"Uploaded {SQLITE_DB_PATH} to s3://{bucket_name}/{sqlite_filename}")
+def write_daily_beach_data_local(all_daily_data_df, write_local=False, sinks: List[str] = None):
+    """
+    Write the data to each enabled sink (or just the given sinks) as a separate (concurrent) task.
+    All sinks are run even if some fail; the flow fails afterwards, listing the failed sinks.
+    The rows' fingerprints are only stored once every sink has written them (see beach_fingerprint)
+    """
+    run_time = pendulum.now()
+    futures = {}
+    for sink in sinks or enabled_sinks(write_local):
+        upstream = [futures[dependency] for dependency in SINK_DEPENDENCIES.get(sink, []) if dependency in futures]
+        futures[sink] = write_sink.submit(sink, all_daily_data_df, run_time, wait_for=upstream)
+
+    report_sink_states({sink: future.wait() for sink, future in futures.items()})
+    store_fingerprints(open_beach_db(SQLITE_DB_PATH), all_daily_data_df)
+
+
+def report_sink_states(states):
+    """
+    Log how each sink's write task ({sink: final state}) went, and fail if any did not complete
+    """
+    logger = get_run_logger()
+    failed = [sink for sink, state in states.items() if not state.is_completed()]
+    for sink, state in states.items():
+        outcome = f"{state.result():.2f}s" if state.is_completed() else state.name
+        logger.info(f"{sink:>12}: {outcome}")
+    if failed:
+        raise RuntimeError(f"Failed to write sink(s): {', '.join(failed)}")
 
 
 # Subflow
 
-@flow(name="Create all beaches list")
-def create_all_beaches_list(base_url: str, bypass: bool) -> List:
+@flow(name="Create all beaches list", task_runner=get_task_runner())
+def create_all_beaches_list(base_url: str, bypass: bool, refresh_policy: str = REFRESH_POLICY) -> List:
+    """
+    Returns [region, beach URL] for every beach, from the stored catalogue
+    (see beach_catalogue) unless the refresh policy says it needs rebuilding
+    """
+    catalogue = None if bypass else load_catalogue(base_url)
+    if refresh_policy == "ttl" and catalogue_is_current(catalogue, refresh_policy):
+        return catalogue["beaches"]
+
     base_html = retrieve_url(base_url)
     region_URLs = create_beach_list(
-        base_url, base_html, "beachmapp/Beaches", bypass)
-    all_beaches = []
-    for region_url in region_URLs:
-        region = region_url.split("/")[-1]
-        region_html = retrieve_url(region_url)
-        beaches_list = create_beach_list(
-            base_url, region_html, "/beachmapp/Beach", bypass)
-        all_beaches.append([region, beaches_list])
-    return [[region, item] for region, sublist in all_beaches for item in sublist]
-
-# TODO: Could cache list of all beaches (as usually unchanged) and re-use
-#       Although this doesn't take long to run
+        base_url, base_html, BEACHMAPP_SPEC.group_links, bypass)
+    root_hash = links_hash(region_URLs)
+    if catalogue_is_current(catalogue, refresh_policy, root_hash=root_hash):
+        return catalogue["beaches"]
+
+    # Fetch and parse the region pages as mapped tasks (run concurrently by the task runner)
+    region_htmls = retrieve_url.map(region_URLs)
+    beaches_lists = create_beach_list.map(
+        unmapped(base_url), region_htmls, unmapped(BEACHMAPP_SPEC.item_links), unmapped(bypass))
+    all_beaches = [
+        [region_url.split("/")[-1], beaches_list.result()]
+        for region_url, beaches_list in zip(region_URLs, beaches_lists)
+    ]
+    beaches = [[region, item] for region, sublist in all_beaches for item in sublist]
+    if not bypass:
+        save_catalogue(base_url, beaches, root_hash)
+    return beaches
 
 N_BEACH_TESTING = 160
 
 # Only get data for this number of beaches for testing (instead of all 160)
 
+
+# Rows of daily data are accumulated column by column (a cheap list append per value)
+# and the DataFrame is built once, rather than growing it one .loc row at a time
+
+def new_daily_data_columns(beachwatch_fields):
+    return {name: [] for name in ["Retrieved", "Region", "Beach URL"] + list(beachwatch_fields.values())
+            + ["Page hash", "Record hash"]}
+
+
+def append_daily_data_row(columns, row):
+    for values, value in zip(columns.values(), row):
+        values.append(value)
+
+
+def daily_data_columns_to_df(columns) -> pd.DataFrame:
+    """
+    Build the typed DataFrame from the accumulated columns:
+    Region is categorical, everything else is a string column,
+    with the list of alerts for each beach joined into one string
+    """
+    all_daily_data_df = pd.DataFrame({
+        name: pd.Series(values, dtype="object" if name == "Alert" else "string")
+        for name, values in columns.items()
+    })
+    all_daily_data_df["Region"] = all_daily_data_df["Region"].astype("category")
+    all_daily_data_df["Alert"] = all_daily_data_df["Alert"].str.join(" ").astype("string")
+    return all_daily_data_df
+
+
+def pending_beaches(beaches_url_list, journal=None):
+    """
+    The [region, beach URL]s not yet scraped in the journal's run (all of them if no journal)
+    """
+    if journal is None:
+        return beaches_url_list
+    done = journal.done_urls()
+    return [[region, beach_url] for region, beach_url in beaches_url_list if beach_url not in done]
+
+
+def log_changed_beaches(n_changed, n_retrieved):
+    get_run_logger().info(f"{n_changed} of {n_retrieved} beaches changed"
+                          + (f" ({n_retrieved - n_changed} unchanged, their stored rows kept)" if SKIP_UNCHANGED else ""))
+
+
+def with_unchanged_beaches(all_daily_data_df, beaches_url_list):
+    """
+    The normalised daily data plus the latest stored row of each beach in the list that
+    was skipped as unchanged, in list order, so that every sink is given the whole day's data
+    """
+    beach_urls = [beach_url for _, beach_url in beaches_url_list[:N_BEACH_TESTING]]
+    unchanged = set(beach_urls) - set(all_daily_data_df["Beach URL"])
+    if not unchanged:
+        return all_daily_data_df
+    stored_df = latest_beach_rows(open_beach_db(SQLITE_DB_PATH), unchanged)
+    df = pd.concat([all_daily_data_df, stored_df.reindex(columns=all_daily_data_df.columns)], ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")   # The concatenated categories differ, so are now objects
+    position = {beach_url: i for i, beach_url in enumerate(beach_urls)}
+    return df.sort_values("Beach URL", key=lambda urls: urls.map(position), kind="stable", ignore_index=True)
+
+
+def journal_columns(journal, beachwatch_fields, beaches_url_list):
+    """
+    Columns of daily data for all the beaches recorded in the journal's run, in beaches_url_list order
+    """
+    columns = new_daily_data_columns(beachwatch_fields)
+    rows = journal.rows()
+    for _, beach_url in beaches_url_list:
+        if beach_url in rows:
+            append_daily_data_row(columns, rows[beach_url])
+    return columns
+
+
 @flow(name="Get daily beach data")
-def get_daily_beach_data(beachwatch_fields: dict, beaches_url_list: List) -> pd.DataFrame:
-    COLUMN_NAMES = ["Retrieved"] + ["Region"] + \
-        list(beachwatch_fields.values())
-    all_daily_data_df = pd.DataFrame(columns=COLUMN_NAMES)
+def get_daily_beach_data(beachwatch_fields: dict, beaches_url_list: List, checkpoint_date: str = None,
+                         skip_unchanged: bool = True) -> pd.DataFrame:
+    """
+    Fetch all the beach pages at once and parse them (in worker processes - see beach_parse_pool).
+    With a checkpoint_date, each beach is recorded in the run journal as it is parsed and
+    only the beaches not already in the journal are fetched; if any page could not be
+    retrieved the flow fails after recording the rest (so a rerun fetches just those).
+    With SKIP_UNCHANGED, only the beaches that changed are returned, unless skip_unchanged is False
+    """
+    beaches_url_list = beaches_url_list[:N_BEACH_TESTING]
+    if checkpoint_date is not None:
+        return get_checkpointed_beach_data(beachwatch_fields, beaches_url_list, RunJournal(checkpoint_date),
+                                           skip_unchanged)
+
+    columns = new_daily_data_columns(beachwatch_fields)
+    known = known_fingerprints(skip_unchanged)
+    beach_pages = retrieve_beach_pages([beach_url for _, beach_url in beaches_url_list])
+
+    pages = ((region, beach_url, beachmapp_html)
+             for (region, beach_url), beachmapp_html in zip(beaches_url_list, beach_pages))
+    with ParsePool(beachwatch_fields) as pool:
+        rows = {beach_url: row for beach_url, row in scrape_beach_rows(pages, beachwatch_fields, known, pool)
+                if row is not None}
+    for _, beach_url in beaches_url_list:   # In the order of the list, as the rows are parsed in any order
+        if beach_url in rows:
+            append_daily_data_row(columns, rows[beach_url])
+
+    log_changed_beaches(len(columns["Retrieved"]), len(beaches_url_list))
+    all_daily_data_df = daily_data_columns_to_df(columns)
+    evict_caches()
 
-    for region, beach_url in beaches_url_list[:N_BEACH_TESTING]:
-        # print(f"\n Beach: {beach_url}\n")
-        beachmapp_html = retrieve_url(beach_url)
-        beach_data = scrape_beach_daily_data(beachmapp_html, beachwatch_fields)
-        scraped_time = pendulum.now().isoformat()
-        all_daily_data_df.loc[len(all_daily_data_df)] = [
-            scraped_time] + [region] + [value for (value, _) in beach_data]
+    return all_daily_data_df
 
-    all_daily_data_df["Alert"] = all_daily_data_df["Alert"].apply(lambda x: " ".join(x))
+
+def get_checkpointed_beach_data(beachwatch_fields, beaches_url_list, journal, skip_unchanged=True) -> pd.DataFrame:
+    """
+    get_daily_beach_data for a checkpointed run: pages arrive (and are recorded) in any order
+    """
+    logger = get_run_logger()
+    pending = pending_beaches(beaches_url_list, journal)
+    logger.info(f"Run {journal.run_date}: {len(beaches_url_list) - len(pending)} beaches already scraped, "
+                f"fetching {len(pending)}")
+
+    regions = {beach_url: region for region, beach_url in pending}
+    known = known_fingerprints(skip_unchanged)
+    failed, n_changed = [], 0
+    retrieved = iter_retrieve_urls(list(regions), cache=HTTP_CACHE if USE_HTTP_CACHE else None)
+    with ParsePool(beachwatch_fields) as pool:
+        for beach_url, row in scrape_beach_rows(retrieved_pages(retrieved, regions, failed), beachwatch_fields,
+                                                known, pool):
+            if row is None:
+                journal.record_unchanged([beach_url])
+            else:
+                journal.record([row])
+                n_changed += 1
+    log_changed_beaches(n_changed, len(pending) - len(failed))
+    if failed:
+        raise RuntimeError(f"Could not retrieve {len(failed)} beaches (rerun to fetch just these)")
+
+    all_daily_data_df = daily_data_columns_to_df(journal_columns(journal, beachwatch_fields, beaches_url_list))
+    evict_caches()
+
+    return all_daily_data_df
+
+
+@flow(name="Get daily beach data (mapped)", task_runner=get_task_runner())
+def get_daily_beach_data_mapped(beachwatch_fields: dict, beaches_url_list: List, max_parallel: int = MAX_PARALLEL,
+                                checkpoint_date: str = None, skip_unchanged: bool = True) -> pd.DataFrame:
+    """
+    As get_daily_beach_data but with fetch and parse as separate mapped tasks,
+    so that parsing of one page overlaps with fetching of the next ones.
+    At most max_parallel pages are fetched at once
+    """
+    logger = get_run_logger()
+    columns = new_daily_data_columns(beachwatch_fields)
+    beaches_url_list = beaches_url_list[:N_BEACH_TESTING]
+    journal = RunJournal(checkpoint_date) if checkpoint_date is not None else None
+    pending = pending_beaches(beaches_url_list, journal)
+    if journal is not None:
+        logger.info(f"Run {journal.run_date}: {len(beaches_url_list) - len(pending)} beaches already scraped, "
+                    f"fetching {len(pending)}")
+
+    known = known_fingerprints(skip_unchanged)
+    start = time.perf_counter()
+    fetches, parses = [], []
+    for i, (region, beach_url) in enumerate(pending):
+        if i >= max_parallel:
+            fetches[i - max_parallel].wait()   # Sliding window of in-flight fetches
+        fetch = retrieve_url.submit(beach_url)
+        fetches.append(fetch)
+        parses.append(parse_beach_page.submit(region, beach_url, fetch, beachwatch_fields, known.get(beach_url)))
+
+    for fetch in fetches:
+        fetch.wait()
+    fetch_seconds = time.perf_counter() - start
+    n_failed, n_changed = 0, 0
+    for (_, beach_url), parse in zip(pending, parses):
+        if journal is None:
+            row = parse.result()
+        else:
+            state = parse.wait()
+            if not state.is_completed():
+                n_failed += 1
+                continue
+            row = state.result()
+        if row is None:
+            if journal is not None:
+                journal.record_unchanged([beach_url])
+            continue
+        n_changed += 1
+        if journal is None:
+            append_daily_data_row(columns, row)
+        else:
+            journal.record([row])
+    parse_seconds = time.perf_counter() - start
+
+    logger.info(f"Fetch stage: {len(fetches)} pages in {fetch_seconds:.1f}s "
+                f"(max_parallel={max_parallel}, task runner={TASK_RUNNER})")
+    logger.info(f"Parse stage: finished {parse_seconds - fetch_seconds:.1f}s after last fetch "
+                f"({parse_seconds:.1f}s total)")
+    log_changed_beaches(n_changed, len(parses) - n_failed)
+
+    if journal is not None:
+        if n_failed:
+            raise RuntimeError(f"Could not retrieve {n_failed} beaches (rerun to fetch just these)")
+        columns = journal_columns(journal, beachwatch_fields, beaches_url_list)
+    all_daily_data_df = daily_data_columns_to_df(columns)
+    evict_caches()
 
     return all_daily_data_df
 
 
+# Streaming mode: each page is parsed as soon as it arrives and the rows are written
+# in batches, so memory use does not grow with the number of beaches and a failure
+# part way through keeps the batches already written.
+# Of the enabled sinks, only STREAM_SINKS are written batch by batch; the others are
+# written once the stream has finished, from the rows stored in SQLite (see stream_sinks)
+
+STREAM_BATCH_SIZE = 20
+STREAM_SINKS = ["sqlite", "parquet"]
+
+
+def stream_sinks(write_local=False):
+    """
+    The enabled sinks, as (the sinks written batch by batch, the sinks written after the stream)
+    """
+    sinks = enabled_sinks(write_local)
+    batch_sinks = [sink for sink in sinks if sink in STREAM_SINKS]
+    after_sinks = [sink for sink in sinks if sink not in STREAM_SINKS]
+    if after_sinks and "sqlite" not in batch_sinks:
+        raise ValueError(f"Stream mode writes the {', '.join(after_sinks)} sink(s) from the SQLite database, "
+                         f"so needs the sqlite sink enabled too")
+    return batch_sinks, after_sinks
+
+
+def stored_daily_data(beaches_url_list):
+    """
+    The latest stored row of each beach in the list, in list order and with the
+    columns in the order of the normalised daily data
+    """
+    beach_urls = [beach_url for _, beach_url in beaches_url_list[:N_BEACH_TESTING]]
+    df = latest_beach_rows(open_beach_db(SQLITE_DB_PATH), beach_urls)
+    columns = ["Retrieved", "Region", "Beach URL"]
+    df = df[columns + [column for column in df.columns if column not in columns]]
+    position = {beach_url: i for i, beach_url in enumerate(beach_urls)}
+    return df.sort_values("Beach URL", key=lambda urls: urls.map(position), kind="stable", ignore_index=True)
+
+
+def flush_batch(columns, beachwatch_fields, db, sinks, journal=None, fingerprints=True):
+    """
+    Normalise and write one batch of rows (then record them in the run journal, if any,
+    and store their fingerprints, unless fingerprints is False).
+    Each sink replaces any earlier rows for the same beaches and days, so writing a
+    batch again (e.g. on a rerun) does not duplicate it.
+    Returns the data dates written
+    """
+    with METRICS.stage("normalise"):
+        batch_df = normalise_daily_beach_data(daily_data_columns_to_df(columns), beachwatch_fields)
+    if "sqlite" in sinks:
+        with METRICS.stage("write sqlite"):
+            upsert_daily_beach_data(db, batch_df)
+    if "parquet" in sinks:
+        with METRICS.stage("write parquet"):
+            write_dataset_partitions(batch_df, DATASET_PATH)
+    if journal is not None:
+        journal.record([list(row) for row in zip(*columns.values())])
+    if fingerprints:
+        store_fingerprints(db, batch_df)
+    return set(data_date(batch_df))
+
+
+@flow(name="Stream daily beach data")
+def stream_daily_beach_data(beachwatch_fields: dict, beaches_url_list: List,
+                            batch_size: int = STREAM_BATCH_SIZE, sinks: List[str] = STREAM_SINKS,
+                            checkpoint_date: str = None, skip_unchanged: bool = True,
+                            fingerprints: bool = True) -> List[str]:
+    """
+    Fetch, parse, normalise and write each beach as it arrives (see iter_retrieve_urls
+    for the bounded queue between fetching and processing), writing every batch_size
+    beaches to the given sinks ("sqlite" and/or "parquet").
+    With a checkpoint_date, beaches are recorded in the run journal once written and
+    beaches already in the journal are not fetched again.
+    The rows' fingerprints are stored as each batch is written, unless fingerprints is
+    False (when other sinks are still to be written).
+    Returns the data dates written (including by earlier attempts of the run)
+    """
+    logger = get_run_logger()
+    beaches_url_list = beaches_url_list[:N_BEACH_TESTING]
+    journal = RunJournal(checkpoint_date) if checkpoint_date is not None else None
+    pending = pending_beaches(beaches_url_list, journal)
+    regions = {beach_url: region for region, beach_url in pending}
+    db = open_beach_db(SQLITE_DB_PATH)
+    columns = new_daily_data_columns(beachwatch_fields)
+    known = known_fingerprints(skip_unchanged)
+    batch, n_written, data_dates, failed = 0, 0, set(), []
+    if journal is not None:
+        logger.info(f"Run {journal.run_date}: {len(beaches_url_list) - len(pending)} beaches already written, "
+                    f"fetching {len(pending)}")
+
+    retrieved = iter_retrieve_urls(list(regions), cache=HTTP_CACHE if USE_HTTP_CACHE else None)
+    with ParsePool(beachwatch_fields) as pool:
+        for beach_url, row in scrape_beach_rows(retrieved_pages(retrieved, regions, failed), beachwatch_fields,
+                                                known, pool):
+            if row is None:
+                if journal is not None:
+                    journal.record_unchanged([beach_url])
+                continue
+            append_daily_data_row(columns, row)
+            if len(columns["Retrieved"]) >= batch_size:
+                data_dates |= flush_batch(columns, beachwatch_fields, db, sinks, journal, fingerprints)
+                n_written += len(columns["Retrieved"])
+                batch += 1
+                columns = new_daily_data_columns(beachwatch_fields)
+
+    if columns["Retrieved"]:
+        data_dates |= flush_batch(columns, beachwatch_fields, db, sinks, journal, fingerprints)
+        n_written += len(columns["Retrieved"])
+        batch += 1
+    evict_caches()
+    log_changed_beaches(n_written, len(pending) - len(failed))
+    logger.info(f"Wrote {n_written} beaches in {batch} batches to {', '.join(sinks)}")
+
+    if failed:
+        raise RuntimeError(f"Could not retrieve {len(failed)} beaches (the other {n_written} were written)")
+    if journal is not None and len(pending) < len(beaches_url_list):
+        journal_df = daily_data_columns_to_df(journal_columns(journal, beachwatch_fields, beaches_url_list))
+        data_dates |= set(data_date(normalise_daily_beach_data(journal_df, beachwatch_fields)))
+    return sorted(data_dates)
+
+
+# Backfill: parse past days again from the archived pages (see beach_archive),
+# e.g. after adding a field to BEACHWATCH_FIELDS or fixing the parser.
+# Each day is parsed in its own worker process and written as soon as it is done
+
+@flow(name="Backfill daily beach data")
+def backfill_beach_data(start_date: str, end_date: str = None, beachwatch_fields: dict = BEACHWATCH_FIELDS,
+                        sinks: List[str] = STREAM_SINKS, max_workers: int = None) -> List[str]:
+    """
+    Parse the archived pages for each day from start_date to end_date (inclusive, "YYYY-MM-DD")
+    with the current beachwatch_fields and parser, and write them to the given sinks
+    ("sqlite" and/or "parquet"), replacing the stored data for those days.
+    Nothing is fetched. max_workers processes (default: one per core) parse days in parallel.
+    Pages archived on different days can be for the same data date (e.g. one retrieved just
+    after midnight), so all the rows are written together, in retrieval order, and the
+    latest retrieval of each beach's data for a date is the one kept.
+    Returns the data dates written
+    """
+    logger = get_run_logger()
+    days = archived_days(start_date, end_date)
+    if not days:
+        logger.warning(f"No archived pages from {start_date} to {end_date or 'now'}")
+        return []
+    logger.info(f"Backfilling {len(days)} days ({days[0]} to {days[-1]}) in {max_workers or os.cpu_count()} worker processes")
+
+    rows = []
+    # Spawned (not forked) workers, as the flow's process has other threads running
+    with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        days_parsed = {executor.submit(parse_archived_day, day, beachwatch_fields): day for day in days}
+        for future in as_completed(days_parsed):
+            day_rows = future.result()
+            rows.extend(day_rows)
+            logger.info(f"{days_parsed[future]}: {len(day_rows)} beaches")
+    if not rows:
+        return []
+
+    columns = new_daily_data_columns(beachwatch_fields)
+    for row in sorted(rows, key=lambda row: pd.Timestamp(row[0])):   # By retrieved time
+        append_daily_data_row(columns, row)
+    return sorted(flush_batch(columns, beachwatch_fields, open_beach_db(SQLITE_DB_PATH), sinks, fingerprints=False))
+
+
+@task
+def check_beach_data_freshness(beaches_url_list):
+    """
+    Returns (True if Beachmapp has new data, message), from a sample of the beach pages
+    """
+    is_new, message = check_freshness(beaches_url_list, open_beach_db(SQLITE_DB_PATH))
+    get_run_logger().info(message)
+    return is_new, message
+
+
+@task
+def normalise_beach_data(all_daily_data_df, beachwatch_fields):
+    """
+    Convert the scraped strings into numeric, categorical and datetime columns
+    (see beach_normalise), including the absolute "Data last updated" time
+    """
+    return normalise_daily_beach_data(all_daily_data_df, beachwatch_fields)
+
+
 # Define Prefect main flow
 
+SCRAPE_MODE = "async"   # "async" (one task fetching all pages), "mapped" (fetch/parse tasks per page)
+                        # or "stream" (fetch, parse and write in batches - see stream_daily_beach_data)
+
+def report_run_metrics():
+    """
+    Log the run's metrics as a summary table and write them out (see beach_metrics)
+    """
+    logger = get_run_logger()
+    logger.info(f"Run metrics:\n{METRICS.summary_table()}")
+    try:
+        written = METRICS.write()
+    except OSError as e:
+        logger.warning(f"Could not write run metrics: {e}")
+    else:
+        logger.info(f"Wrote run metrics to {', '.join(str(path) for path in written)}")
+
+
 @flow(name="Main flow: daily-beach-data-job")
-def beach_data_daily_job():
-    WRITE_LOCAL_FILE = False
-    beaches_url_list = create_all_beaches_list(BEACHMAPP_BASE_URL, False)
-    print(type(beaches_url_list))
-    all_daily_data_df = get_daily_beach_data(BEACHWATCH_FIELDS, beaches_url_list)
-    print(type(all_daily_data_df))
+def beach_data_daily_job(rerun: bool = False):
+    """
+    With CHECKPOINT_RUNS, a failed run is resumed by running the job again on the same day,
+    and once today's data has been written later runs only scrape again if the freshness
+    check finds newer data (without CHECK_FRESHNESS they do nothing, unless rerun is True).
+    With CHECK_FRESHNESS, the run finishes early (Completed, with the reason as its message)
+    if the pages have not been updated since the stored data.
+    Timings for each beach and stage are reported at the end (see report_run_metrics)
+    """
+    METRICS.reset()
     try:
-        if N_BEACH_TESTING == 160:
-            write_daily_beach_data_local(all_daily_data_df, WRITE_LOCAL_FILE)
+        with METRICS.stage("run"):
+            return run_daily_job(rerun)
+    finally:
+        report_run_metrics()
+
+
+def run_daily_job(rerun=False):
+    journal = RunJournal(today()) if CHECKPOINT_RUNS else None
+    if journal is not None and rerun:
+        journal.reset()
+    complete = journal is not None and journal.is_complete()
+    if complete and not CHECK_FRESHNESS:
+        print(f"\nSkipping: the run for {journal.run_date} is already complete\n")
+        return
+
+    with METRICS.stage("catalogue"):
+        beaches_url_list = create_all_beaches_list(BEACHMAPP_BASE_URL, False)
+    print(type(beaches_url_list))
+    resuming = journal is not None and journal.is_unfinished()
+    if CHECK_FRESHNESS and not rerun and not resuming:
+        with METRICS.stage("freshness check"):
+            is_new, message = check_beach_data_freshness(beaches_url_list)
+        if not is_new:
+            return Completed(message=message)
+        if complete:
+            journal.reset()   # Beachmapp has been updated since today's run completed: run again
+    if journal is None:
+        return scrape_and_write_daily_data(beaches_url_list, rerun=rerun)
+    with journal.running():   # Marked as failed if this raises, so the next run resumes it
+        return scrape_and_write_daily_data(beaches_url_list, journal, rerun)
+
+
+def scrape_and_write_daily_data(beaches_url_list, journal=None, rerun=False):
+    WRITE_LOCAL_FILE = False
+    checkpoint_date = journal.run_date if journal is not None else None
+    if SCRAPE_MODE == "stream":
+        batch_sinks, after_sinks = stream_sinks(WRITE_LOCAL_FILE)
+        with METRICS.stage("stream"):
+            # With sinks still to write, the fingerprints are stored once they have been written
+            data_dates = stream_daily_beach_data(BEACHWATCH_FIELDS, beaches_url_list, sinks=batch_sinks,
+                                                 checkpoint_date=checkpoint_date, skip_unchanged=not rerun,
+                                                 fingerprints=not after_sinks)
+        if data_dates and after_sinks:
+            with METRICS.stage("write"):
+                write_daily_beach_data_local(stored_daily_data(beaches_url_list), WRITE_LOCAL_FILE, after_sinks)
+        if journal is not None and not journal.finish(len(beaches_url_list[:N_BEACH_TESTING])):
+            return Completed(message="No beaches changed: nothing to write")
+        return
+    with METRICS.stage("scrape"):
+        if SCRAPE_MODE == "mapped":
+            all_daily_data_df = get_daily_beach_data_mapped(BEACHWATCH_FIELDS, beaches_url_list,
+                                                            checkpoint_date=checkpoint_date, skip_unchanged=not rerun)
         else:
-            print("\nSkipping data write: Test run only\n")
-    except Exception as e:
-        print(f"\nData write error: {e}\n")
+            all_daily_data_df = get_daily_beach_data(BEACHWATCH_FIELDS, beaches_url_list, checkpoint_date,
+                                                     skip_unchanged=not rerun)
+    if all_daily_data_df.empty:
+        if journal is not None:
+            journal.reset()   # Nothing new was written, so later runs today check for new data again
+        return Completed(message="No beaches changed: nothing to write")
+    with METRICS.stage("normalise"):
+        all_daily_data_df = normalise_beach_data(all_daily_data_df, BEACHWATCH_FIELDS)
+        all_daily_data_df = with_unchanged_beaches(all_daily_data_df, beaches_url_list)
+    print(type(all_daily_data_df))
+    if N_BEACH_TESTING == 160:
+        with METRICS.stage("write"):
+            write_daily_beach_data_local(all_daily_data_df, WRITE_LOCAL_FILE)   # Fails this flow if a sink fails
+        if journal is not None:
+            journal.mark_complete(len(all_daily_data_df))
+    else:
+        if journal is not None:
+            journal.reset()
+        print("\nSkipping data write: Test run only\n")
 
 # Run main flow
 
@@ -226,12 +884,6 @@ if __name__ == "__main__":
 
 
 
-# TODO: Validation: Check that the data has actually been updated "NN minutes ago" 
-#       from the "Data last updated" field
-
-
-
-
 # TODO: Below not using Deployment / Schedule as yet - see example:
 
 # See: https://www.prefect.io/guide/blog/orchestrate-your-data-science-project-with-prefect-2-0/#ScheduleYourFlows
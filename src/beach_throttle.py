@@ -0,0 +1,180 @@
+# Adaptive rate limiting and circuit breaking for requests to each host
+#
+# Every request to a host (from the async fetcher or the retrieve_url task, in any
+# thread) goes through that host's HostThrottle, shared by the whole process:
+#   - a token bucket limits the request rate (RATE_PER_SECOND, bursts of up to BURST)
+#   - the number of requests in flight is limited adaptively (AIMD): the limit grows by
+#     about one per round of successful responses, and is halved on a 429 / 5xx response,
+#     a connection error or timeout, or a response much slower than usual (latency spike)
+#   - a Retry-After header pauses all requests to the host until then
+#   - after BREAKER_FAILURES failures in a row the circuit opens and requests fail fast
+#     (CircuitOpenError) for BREAKER_RESET_SECONDS, after which requests are tried again
+#
+# The state is protected by a lock and callers wait by sleeping for the time returned
+# by try_acquire (time.sleep or asyncio.sleep), so the same throttle works for both.
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+RATE_PER_SECOND = 10.0
+BURST = 10
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 8           # Maximum in-flight requests to any one host
+DECREASE_FACTOR = 0.5
+LATENCY_SPIKE_FACTOR = 3.0    # A response this many times slower than the average is a sign of overload
+LATENCY_SMOOTHING = 0.2       # Weight of each new response time in the moving average
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 60
+MAX_RETRY_AFTER_SECONDS = 300
+MAX_RETRY_DELAY_SECONDS = 60
+POLL_SECONDS = 0.05           # How often to check for a free slot when at the concurrency limit
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class HostThrottle:
+    def __init__(self, host, rate=RATE_PER_SECOND, burst=BURST, concurrency=INITIAL_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, breaker_failures=BREAKER_FAILURES,
+                 breaker_reset_seconds=BREAKER_RESET_SECONDS):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.concurrency = float(min(concurrency, max_concurrency))
+        self.in_flight = 0
+        self.latency = None           # Moving average response time (seconds)
+        self.decreased_at = 0.0
+        self.failures = 0             # Consecutive failures
+        self.opened_at = None         # When the circuit was opened (None if closed)
+
+    def try_acquire(self):
+        """
+        Take a request slot and token if available, returning 0.
+        Otherwise returns the number of seconds to wait before trying again.
+        Raises CircuitOpenError if the circuit is open
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.opened_at is not None:
+                if now - self.opened_at < self.breaker_reset_seconds:
+                    raise CircuitOpenError(f"Circuit open for {self.host} after {self.failures} failures in a row")
+                # Half open: let requests through again, but the next failure re-opens the circuit
+                self.opened_at = None
+                self.failures = self.breaker_failures - 1
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.concurrency):
+                return POLL_SECONDS
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        while (wait := self.try_acquire()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while (wait := self.try_acquire()) > 0:
+            await asyncio.sleep(wait)
+
+    def cancel(self):
+        """
+        Give back the slot taken by try_acquire without a response (e.g. the request was cancelled)
+        """
+        with self.lock:
+            self.in_flight -= 1
+
+    def release(self, status_code=None, latency=None, retry_after=None):
+        """
+        Give back the slot taken by try_acquire, given the response status code and time
+        (status_code None for a connection error or timeout), and adjust the limits
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.in_flight -= 1
+            failed = status_code is None or status_code == 429 or status_code >= 500
+            spike = (not failed and latency is not None and self.latency is not None
+                     and latency > LATENCY_SPIKE_FACTOR * self.latency)
+
+            if failed:
+                self.failures += 1
+                if self.failures >= self.breaker_failures and self.opened_at is None:
+                    self.opened_at = now
+            else:
+                self.failures = 0
+                if latency is not None:
+                    self.latency = latency if self.latency is None else (
+                        (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * latency)
+
+            if failed or spike:
+                # Multiplicative decrease, at most once per round trip
+                if now - self.decreased_at > (self.latency or 0):
+                    self.concurrency = max(MIN_CONCURRENCY, self.concurrency * DECREASE_FACTOR)
+                    self.decreased_at = now
+            else:
+                # Additive increase: about +1 for each round of `concurrency` successful requests
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + min(retry_after, MAX_RETRY_AFTER_SECONDS))
+
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def host_throttle(url):
+    """
+    The (process wide) HostThrottle for the host of url
+    """
+    host = urlsplit(url).netloc
+    with _throttles_lock:
+        if host not in _throttles:
+            _throttles[host] = HostThrottle(host)
+        return _throttles[host]
+
+
+def retry_after_seconds(response):
+    """
+    The delay asked for by the response's Retry-After header (seconds or an HTTP date), or None
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt, base_seconds, retry_after=None):
+    """
+    Exponential backoff with jitter (between half and all of base_seconds * 2 ** attempt),
+    but no less than any Retry-After
+    """
+    delay = min(MAX_RETRY_DELAY_SECONDS, base_seconds * 2 ** attempt)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    return max(delay, min(retry_after or 0, MAX_RETRY_AFTER_SECONDS))
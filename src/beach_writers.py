@@ -0,0 +1,110 @@
+# Output writers ("sinks") for the daily beach data
+#
+# Each sink is an independent function taking the (normalised) daily data and the
+# run time, and returning a short description of what it wrote. The write flow runs
+# each enabled sink as its own task, so sinks run concurrently and a failure in one
+# does not stop the others. A sink only waits for the sinks listed in SINK_DEPENDENCIES.
+#
+# The enabled sinks are configured in settings.toml (BEACH_SINKS, or
+# BEACH_SINKS_LOCAL when writing local files), e.g. DYNACONF_BEACH_SINKS='["sqlite"]'
+
+import pendulum
+
+from beach_dataset import DATASET_PATH, dataset_s3_keys, partition_files, write_dataset_partitions
+from beach_normalise import data_date, without_timezones
+from beach_publish import PUBLISH_MODE, publish_daily_partitions, publish_sqlite_if_changed
+from beach_sqlite import SQLITE_DB_PATH, open_beach_db, upsert_daily_beach_data
+from config import settings
+from scaleway_s3_storage import connect_to_s3, dataframe_to_csv_s3, upload_files_to_s3
+
+BUCKET_NAME = "databooth-beach-swim"
+LOCAL_DATA_FILENAME = "data/all_beach_daily_data_"
+S3_DATA_FILENAME = "all_beach_daily_data.csv"   # Latest data only
+
+DEFAULT_SINKS = ["parquet", "sqlite", "s3-csv", "s3-dataset", "s3-sqlite"]
+DEFAULT_LOCAL_SINKS = ["parquet", "csv", "xlsx", "sqlite", "s3-sqlite"]
+
+
+def write_parquet(all_daily_data_df, run_time):
+    written = write_dataset_partitions(all_daily_data_df, DATASET_PATH)
+    return f"{len(written)} partition files in {DATASET_PATH}"
+
+
+def write_csv(all_daily_data_df, run_time):
+    data_csv = f"{LOCAL_DATA_FILENAME}{run_time.isoformat()}.csv"
+    all_daily_data_df.to_csv(data_csv, index=False)
+    return data_csv
+
+
+def write_xlsx(all_daily_data_df, run_time):
+    data_xlsx = f"{LOCAL_DATA_FILENAME}{run_time.isoformat()}.xlsx"
+    without_timezones(all_daily_data_df).to_excel(data_xlsx, index=False)
+    return data_xlsx
+
+
+def write_sqlite(all_daily_data_df, run_time):
+    db = open_beach_db(SQLITE_DB_PATH)
+    n_rows = upsert_daily_beach_data(db, all_daily_data_df)
+    return f"{n_rows} rows to {SQLITE_DB_PATH}"
+
+
+def write_s3_csv(all_daily_data_df, run_time):
+    if not dataframe_to_csv_s3(connect_to_s3(), all_daily_data_df, BUCKET_NAME, S3_DATA_FILENAME):
+        raise IOError(f"Failed to write s3://{BUCKET_NAME}/{S3_DATA_FILENAME}")
+    return f"s3://{BUCKET_NAME}/{S3_DATA_FILENAME}"
+
+
+def write_s3_dataset(all_daily_data_df, run_time):
+    dataset_files = partition_files(all_daily_data_df, DATASET_PATH)
+    if not all(upload_files_to_s3(connect_to_s3(), dataset_files, BUCKET_NAME,
+                                  dataset_s3_keys(dataset_files, DATASET_PATH))):
+        raise IOError(f"Failed to upload partition files to s3://{BUCKET_NAME}")
+    return f"{len(dataset_files)} partition files to s3://{BUCKET_NAME}"
+
+
+def publish_sqlite(data_dates):
+    # Publish just the given day(s), or the whole file if changed (see beach_publish)
+    s3 = connect_to_s3()
+    if PUBLISH_MODE == "delta":
+        days = publish_daily_partitions(s3, open_beach_db(SQLITE_DB_PATH), BUCKET_NAME, data_dates)
+        return f"{len(days)} day(s) to s3://{BUCKET_NAME}"
+    uploaded = publish_sqlite_if_changed(s3, SQLITE_DB_PATH, BUCKET_NAME)
+    return f"{SQLITE_DB_PATH} to s3://{BUCKET_NAME}" if uploaded else "unchanged"
+
+
+def write_s3_sqlite(all_daily_data_df, run_time):
+    return publish_sqlite(data_date(all_daily_data_df).unique())
+
+
+WRITERS = {
+    "parquet": write_parquet,
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "sqlite": write_sqlite,
+    "s3-csv": write_s3_csv,
+    "s3-dataset": write_s3_dataset,
+    "s3-sqlite": write_s3_sqlite,
+}
+
+SINK_DEPENDENCIES = {
+    "s3-dataset": ["parquet"],
+    "s3-sqlite": ["sqlite"],
+}
+
+
+def enabled_sinks(write_local=False):
+    """
+    The configured sinks, ordered so that each sink comes after the sinks it depends on
+    """
+    if write_local:
+        sinks = settings.get("BEACH_SINKS_LOCAL", DEFAULT_LOCAL_SINKS)
+    else:
+        sinks = settings.get("BEACH_SINKS", DEFAULT_SINKS)
+    unknown = set(sinks) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"Unknown sink(s): {', '.join(sorted(unknown))} (available: {', '.join(WRITERS)})")
+    return [sink for sink in WRITERS if sink in sinks]
+
+
+def run_writer(sink, all_daily_data_df, run_time=None):
+    return WRITERS[sink](all_daily_data_df, run_time or pendulum.now())
@@ -0,0 +1,146 @@
+# On-disk HTTP cache for Beachmapp pages (conditional GET)
+#
+# The pages only change once a day (about 7:30AM) but the job runs hourly, so each
+# page's body is stored along with its ETag / Last-Modified headers and subsequent
+# requests are sent as conditional GETs. A 304 (Not Modified) response re-uses the
+# stored body and, if the parsed record for that page was also stored, the page
+# does not need to be parsed again.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+HTTP_CACHE_DIR = "data/http_cache"
+MAX_CACHE_BYTES = 100 * 1024 * 1024   # Evict least recently used entries beyond this size
+MAX_AGE_SECONDS = 7 * 24 * 60 * 60    # Evict entries not used for this long
+
+
+class HttpCache:
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, max_bytes=MAX_CACHE_BYTES, max_age_seconds=MAX_AGE_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.html"
+
+    def _read_meta(self, url):
+        meta_path, _ = self._paths(url)
+        try:
+            return json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, text):
+        # Write then rename so that a concurrent reader never sees a partial file. The
+        # temporary file is named for the whole file name (not just its stem, which the
+        # .json and .html share) and the writing process and thread
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+
+    def conditional_headers(self, url):
+        """
+        Returns the If-None-Match / If-Modified-Since headers for a request to url
+        (empty if url has not been cached)
+        """
+        meta = self._read_meta(url)
+        headers = {}
+        if meta is not None and self._paths(url)[1].exists():
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def update(self, url, response):
+        """
+        Given the response to a (conditional) request for url, returns the page html:
+        the stored body for a 304, otherwise the new body (which is then stored).
+        Raises httpx.HTTPStatusError for error responses, like raise_for_status
+        """
+        meta_path, body_path = self._paths(url)
+        if response.status_code == 304:
+            meta = self._read_meta(url)
+            if meta is not None and body_path.exists():
+                meta["not_modified"] = True
+                meta["used_at"] = time.time()
+                self._write(meta_path, json.dumps(meta))
+                return body_path.read_text()
+        response.raise_for_status()
+
+        text = response.text
+        now = time.time()
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "stored_at": now,
+            "used_at": now,
+            "size": len(text.encode()),
+            "not_modified": False,
+            "record": None,
+        }
+        if meta["etag"] or meta["last_modified"]:
+            self._write(body_path, text)
+            self._write(meta_path, json.dumps(meta))
+        else:
+            # Nothing to revalidate with: drop any earlier entry, so that its stored record
+            # (for a page that has now changed) is not taken for this page's
+            self.remove(url)
+        return text
+
+    def remove(self, url):
+        for path in self._paths(url):
+            path.unlink(missing_ok=True)
+
+    def cached_record(self, url):
+        """
+        Returns the stored parsed record for url if the last request for it was
+        answered with a 304 (i.e. the page has not changed since it was parsed)
+        """
+        meta = self._read_meta(url)
+        if meta is not None and meta.get("not_modified"):
+            return meta.get("record")
+        return None
+
+    def store_record(self, url, record):
+        """
+        Store the parsed record for url (must be JSON serialisable)
+        """
+        meta = self._read_meta(url)
+        if meta is not None:
+            meta["record"] = record
+            self._write(self._paths(url)[0], json.dumps(meta))
+
+    def evict(self):
+        """
+        Remove entries not used within max_age_seconds, then the least recently
+        used entries until the cache is no larger than max_bytes
+        """
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for meta_path in self.cache_dir.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                meta = {}
+            entries.append((meta.get("used_at", 0), meta.get("size", 0), meta_path))
+
+        now = time.time()
+        total_bytes = sum(size for _, size, _ in entries)
+        for used_at, size, meta_path in sorted(entries):
+            if now - used_at <= self.max_age_seconds and total_bytes <= self.max_bytes:
+                break
+            meta_path.unlink(missing_ok=True)
+            meta_path.with_suffix(".html").unlink(missing_ok=True)
+            total_bytes -= size
+
+
+HTTP_CACHE = HttpCache()
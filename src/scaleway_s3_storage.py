@@ -6,12 +6,18 @@
 #       objects in the bucket is publicly visible or not; it does not affect the visibility
 #       of objects themselves - a file (object) uploaded to a public bucket is private by default).
 
-import io
+import gzip
+import json
 import logging
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from config import settings
 
@@ -31,24 +37,74 @@ if (
 else:                                      # use environment variables (deployed on Streamlit Sharing)
     SECRET_ACCESS_KEY = os.environ["SCALEWAY_SECRET_ACCESS_KEY"]
 
+# Transfers: files above MULTIPART_THRESHOLD are sent in MULTIPART_CHUNKSIZE parts,
+# MAX_CONCURRENCY parts at a time
+
+MB = 1024 * 1024
+MULTIPART_THRESHOLD = 16 * MB
+MULTIPART_CHUNKSIZE = 16 * MB
+MAX_CONCURRENCY = 8
+MAX_PARALLEL_FILES = 8    # Files transferred at once by upload_files_to_s3 / download_s3_files
+SPOOL_MAX_BYTES = 16 * MB  # DataFrames are rendered into memory up to this size, then to a temporary file
+CSV_CHUNK_ROWS = 10000
+DATAFRAME_FORMATS = ("csv.gz", "parquet", "csv")   # For dataframe_to_s3, in the order the extension is matched
+
+
+def make_transfer_config(multipart_threshold=MULTIPART_THRESHOLD, multipart_chunksize=MULTIPART_CHUNKSIZE,
+                         max_concurrency=MAX_CONCURRENCY):
+    return TransferConfig(
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_chunksize,
+        max_concurrency=max_concurrency,
+        use_threads=max_concurrency > 1,
+    )
+
+
+TRANSFER_CONFIG = make_transfer_config()
+
+
+# One S3 client is shared by everything in a process: creating a client loads the botocore
+# service models and each client has its own pool of (TLS) connections.
+# boto3 clients are thread safe, but are not shared across processes (or forks),
+# so the clients are kept per process id.
+
+MAX_POOL_CONNECTIONS = 32   # Should be at least MAX_PARALLEL_FILES * MAX_CONCURRENCY
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+
+def get_s3_client(max_pool_connections=MAX_POOL_CONNECTIONS):
+    pid = os.getpid()
+    s3 = _s3_clients.get(pid)
+    if s3 is None:
+        with _s3_clients_lock:
+            s3 = _s3_clients.get(pid)
+            if s3 is None:
+                # Own session, as creating clients from the default session is not thread safe
+                s3 = boto3.session.Session().client(
+                    "s3",
+                    region_name=REGION_NAME,
+                    endpoint_url=ENDPOINT_URL,
+                    aws_access_key_id=ACCESS_KEY_ID,
+                    aws_secret_access_key=SECRET_ACCESS_KEY,
+                    config=Config(max_pool_connections=max_pool_connections, tcp_keepalive=True),
+                )
+                _s3_clients[pid] = s3
+    return s3
+
 
 def connect_to_s3():
-    return boto3.client(
-        "s3",
-        region_name=REGION_NAME,
-        endpoint_url=ENDPOINT_URL,
-        aws_access_key_id=ACCESS_KEY_ID,
-        aws_secret_access_key=SECRET_ACCESS_KEY,
-    )
+    return get_s3_client()
 
 
-def download_s3_file(s3, local_filename, bucket_name, s3_filename):
+def download_s3_file(s3, local_filename, bucket_name, s3_filename, config=TRANSFER_CONFIG):
     with open(local_filename, "wb") as local_filename:
-        s3.download_fileobj(bucket_name, s3_filename, local_filename)
+        s3.download_fileobj(bucket_name, s3_filename, local_filename, Config=config)
         return Path(local_filename.name)
 
 
-def upload_file_to_s3(s3, file_name, bucket_name, object_name=None):
+def upload_file_to_s3(s3, file_name, bucket_name, object_name=None, config=TRANSFER_CONFIG):
     """Upload a file to an S3 bucket
     :param file_name: File to upload
     :param bucket_name: Bucket to upload to
@@ -61,7 +117,7 @@ def upload_file_to_s3(s3, file_name, bucket_name, object_name=None):
 
     # Upload the file
     try:
-        response = s3.upload_file(file_name, bucket_name, object_name)
+        response = s3.upload_file(file_name, bucket_name, object_name, Config=config)
     except ClientError as e:
         logging.error(e)
         return False
@@ -70,9 +126,87 @@ def upload_file_to_s3(s3, file_name, bucket_name, object_name=None):
 
 # c.f. https://towardsdatascience.com/reading-and-writing-files-from-to-amazon-s3-with-pandas-ccaf90bfe86c
 
+def write_csv_chunks(df, binary_file, chunk_rows=CSV_CHUNK_ROWS):
+    """Write a DataFrame as utf-8 csv to a binary file object, rendering chunk_rows rows at a time
+    (rather than through io.TextIOWrapper, which needs more of the file object than
+    SpooledTemporaryFile has before Python 3.11)
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+        binary_file.write(chunk.encode("utf-8"))
+
+
+def dataframe_to_s3(s3, df, bucket_name, filename, file_format=None, config=TRANSFER_CONFIG):
+    """Write a DataFrame to S3 as csv, gzipped csv or parquet
+    :param file_format: "csv", "csv.gz" or "parquet". If not specified it is taken from the filename
+    :return: True if the DataFrame was uploaded, else False
+    The file is rendered in chunks into a spooled temporary file (in memory up to SPOOL_MAX_BYTES,
+    then on disk) and uploaded from there, in parts if it is large, so the whole file
+    is never held in memory as a string
+    """
+    if file_format is None:
+        file_format = next((fmt for fmt in DATAFRAME_FORMATS if filename.endswith(fmt)), None)
+    if file_format not in DATAFRAME_FORMATS:
+        raise ValueError(f"Unsupported format for {filename}: {file_format or 'unrecognised extension'} "
+                         f"(supported: {', '.join(DATAFRAME_FORMATS)})")
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+        if file_format == "parquet":
+            df.to_parquet(spool, index=False)
+        else:
+            binary = gzip.GzipFile(fileobj=spool, mode="wb") if file_format == "csv.gz" else spool
+            write_csv_chunks(df, binary)
+            if binary is not spool:
+                binary.close()   # Writes the gzip trailer (leaves spool open)
+        spool.seek(0)
+        try:
+            s3.upload_fileobj(spool, bucket_name, filename, Config=config)
+        except ClientError as e:
+            logging.error(e)
+            return False
+    return True
+
+
 def dataframe_to_csv_s3(s3, df, bucket_name, filename):
-    with io.StringIO() as csv_buffer:
-        df.to_csv(csv_buffer, index=False)
-        response = s3.put_object(Bucket=bucket_name, Key=filename, Body=csv_buffer.getvalue())
-        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
-        return status == 200
+    return dataframe_to_s3(s3, df, bucket_name, filename, "csv")
+
+
+def upload_files_to_s3(s3, file_names, bucket_name, object_names=None, max_workers=MAX_PARALLEL_FILES,
+                       config=TRANSFER_CONFIG):
+    """Upload several files in parallel (S3 clients are thread safe)
+    :return: list of True/False for each file, as for upload_file_to_s3
+    """
+    object_names = object_names or [None] * len(file_names)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda names: upload_file_to_s3(s3, names[0], bucket_name, names[1], config),
+            zip(file_names, object_names)))
+
+
+def download_s3_files(s3, local_filenames, bucket_name, s3_filenames, max_workers=MAX_PARALLEL_FILES,
+                      config=TRANSFER_CONFIG):
+    """Download several files in parallel
+    :return: list of the local Paths
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda names: download_s3_file(s3, names[0], bucket_name, names[1], config),
+            zip(local_filenames, s3_filenames)))
+
+
+def read_json_s3(s3, bucket_name, filename, default=None):
+    """Returns the parsed JSON object, or default if the object does not exist"""
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=filename)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return default
+        raise
+    return json.loads(response["Body"].read())
+
+
+def write_json_s3(s3, obj, bucket_name, filename):
+    response = s3.put_object(Bucket=bucket_name, Key=filename, Body=json.dumps(obj, indent=1).encode(),
+                             ContentType="application/json")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status == 200
@@ -0,0 +1,131 @@
+# Generic scraping engine for any site declared by a SiteSpec (see site_spec)
+#
+# For each site the root page is fetched, then all its group pages at once, to list the
+# item pages. The item pages are fetched concurrently (through each host's throttle and
+# the HTTP cache - see beach_fetch and http_cache) and parsed as they arrive, in worker
+# processes (see beach_parse_pool), giving a DataFrame with a row per item:
+#   Retrieved, Group, URL, then a column per field (a multi-value field's values joined by spaces)
+#
+# The scrape_sites flow scrapes several sites in one run, each as its own concurrent task,
+# and writes each site's rows to data/sites/<site name>/<date>.parquet.
+#
+# The beach job (beach_swim_daily_job) takes its links and fields from the Beachmapp spec,
+# but has its own pipeline for the beach-specific steps (change detection, normalising, sinks).
+
+from pathlib import Path
+from typing import List, NamedTuple
+
+import pandas as pd
+import pendulum
+from prefect import flow, get_run_logger, task
+from prefect.task_runners import ConcurrentTaskRunner
+
+from beach_checkpoint import today
+from beach_extract import PARSER_BACKEND, ExtractionPlan, extraction_plan, page_links
+from beach_fetch import iter_retrieve_urls, retrieve_urls
+from beach_parse_pool import PARSE_WORKERS, ParsePool
+from http_cache import HTTP_CACHE
+from site_spec import SITE_SPECS, SiteSpec
+
+SITES_PATH = "data/sites"
+
+
+class CompiledSite(NamedTuple):
+    spec: SiteSpec
+    plan: ExtractionPlan
+
+
+def compile_site(spec):
+    return CompiledSite(spec, extraction_plan(spec.fields))
+
+
+def discover_items(site, cache=None):
+    """
+    [group, item URL] for every item page of the site, the group being the last part of its page's URL
+    """
+    spec = site.spec
+    root_html = retrieve_urls([spec.base_url], cache=cache)[0]
+    group_urls = list(dict.fromkeys(page_links(spec.base_url, root_html, spec.group_links)))
+    group_htmls = retrieve_urls(group_urls, cache=cache)
+    return [
+        [group_url.rstrip("/").split("/")[-1], item_url]
+        for group_url, group_html in zip(group_urls, group_htmls)
+        for item_url in page_links(spec.base_url, group_html, spec.item_links)
+    ]
+
+
+def site_rows_to_df(site, rows) -> pd.DataFrame:
+    columns = ["Retrieved", "Group", "URL"] + [field.name for field in site.plan.fields]
+    df = pd.DataFrame(rows, columns=columns, dtype="object")
+    for field in site.plan.fields:
+        if field.multi:
+            df[field.name] = df[field.name].map(lambda value: value if isinstance(value, str) else " ".join(value))
+    return df.astype("string")
+
+
+def scrape_items(site, items, cache=None, max_workers=PARSE_WORKERS, backend=PARSER_BACKEND):
+    """
+    Fetch and parse the item pages ([group, item URL] as from discover_items).
+    Returns (DataFrame of the items retrieved, in the order of items; the URLs that could not be retrieved)
+    """
+    groups = {item_url: group for group, item_url in items}
+    rows, failed = {}, []
+
+    def add_rows(parsed):
+        for (item_url, retrieved), (values, _) in parsed:
+            rows[item_url] = [retrieved, groups[item_url], item_url] + list(values)
+
+    with ParsePool(site.plan, max_workers, backend) as pool:
+        for item_url, item_html in iter_retrieve_urls(list(groups), cache=cache):
+            if isinstance(item_html, Exception):
+                failed.append(item_url)
+                continue
+            pool.submit((item_url, pendulum.now().isoformat()), item_html)
+            add_rows(pool.done())
+        add_rows(pool.results())
+    return site_rows_to_df(site, [rows[item_url] for item_url in groups if item_url in rows]), failed
+
+
+def write_site_data(site_df, site_name, run_date=None, root=SITES_PATH):
+    path = Path(root, site_name, f"{run_date or today()}.parquet")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    site_df.to_parquet(path, index=False)
+    return path
+
+
+@task
+def scrape_site(spec: SiteSpec):
+    """
+    Discover, fetch and parse all the items of a site, and write them out.
+    Fails (after writing the rest) if any item page could not be retrieved
+    """
+    logger = get_run_logger()
+    site = compile_site(spec)
+    items = discover_items(site, HTTP_CACHE)
+    site_df, failed = scrape_items(site, items, HTTP_CACHE)
+    path = write_site_data(site_df, spec.name)
+    logger.info(f"{spec.name}: {len(site_df)} of {len(items)} items to {path}")
+    if failed:
+        raise RuntimeError(f"{spec.name}: could not retrieve {len(failed)} items, e.g. {failed[0]}")
+    return str(path)
+
+
+@flow(name="Scrape sites", task_runner=ConcurrentTaskRunner())
+def scrape_sites(specs: List[SiteSpec] = SITE_SPECS):
+    """
+    Scrape each site (see scrape_site) concurrently. All sites are scraped even if some
+    fail; the flow fails afterwards, listing the failed sites
+    """
+    logger = get_run_logger()
+    futures = {spec.name: scrape_site.submit(spec) for spec in specs}
+    states = {name: future.wait() for name, future in futures.items()}
+    for name, state in states.items():
+        logger.info(f"{name:>16}: {state.result() if state.is_completed() else state.name}")
+    HTTP_CACHE.evict()
+    failed = [name for name, state in states.items() if not state.is_completed()]
+    if failed:
+        raise RuntimeError(f"Failed to scrape site(s): {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    scrape_sites()
@@ -0,0 +1,74 @@
+# Declarative specs for the sites scraped
+#
+# A site is described by where to start, which links to follow and which fields to
+# extract from each item page, rather than by code:
+#   base_url    - the root page, linking to the group (e.g. region) pages
+#   group_links - follow the root page links whose href contains this
+#   item_links  - on each group page, follow the links whose href contains this to the item (e.g. beach) pages
+#   fields      - the values on each item page: the class name of the div / span holding
+#                 the value, the tags to look in (in order of preference), and whether the
+#                 field has one value per matching element (e.g. the alerts) or just the first,
+#                 and the value to give it when it is missing (the class name by default)
+#
+# Specs are pydantic models, so a new site can also be declared as data, e.g.
+# SiteSpec.parse_file("sites/other_site.json"). Their fields are compiled once into the
+# extraction plan used for every page (see beach_extract.extraction_plan).
+#
+# Only depends on pydantic, so it can be imported from outside src/ (e.g. prefect2_daily_job.py).
+
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+DEFAULT_TAGS = ("div", "span")
+
+
+class FieldSpec(BaseModel):
+    classname: str
+    name: str                              # Column name for the field
+    tags: Tuple[str, ...] = DEFAULT_TAGS   # Tags to look in, in order of preference
+    multi: bool = False                    # A list of the values of all matching elements, not just the first
+    default: Optional[str] = None          # The value when the field is missing (None: the class name)
+
+
+class SiteSpec(BaseModel):
+    name: str
+    base_url: str
+    group_links: str
+    item_links: str
+    fields: List[FieldSpec]
+
+    def field_names(self) -> Dict[str, str]:
+        """
+        {class name: column name} for the fields, as BEACHWATCH_FIELDS
+        """
+        return {field.classname: field.name for field in self.fields}
+
+
+BEACHMAPP_SPEC = SiteSpec(
+    name="beachmapp",
+    base_url="https://www.environment.nsw.gov.au/beachmapp",
+    group_links="beachmapp/Beaches",
+    item_links="/beachmapp/Beach",
+    fields=[
+        FieldSpec(classname="navbar-title-text", name="Beach name"),
+        FieldSpec(classname="beach-timelapse-panel", name="Data last updated"),
+        FieldSpec(classname="bw-status-text", name="Pollution status"),
+        FieldSpec(classname="bw-air-temp-value", name="Maximum forecast air temperature"),
+        FieldSpec(classname="bw-ocean-temp-value", name="Water temperature"),
+        FieldSpec(classname="bw-weather-text", name="Weather forecast"),
+        FieldSpec(classname="bw-swell", name="Swell"),
+        FieldSpec(classname="bw-wind", name="Wind"),
+        FieldSpec(classname="bw-patrol-info", name="Patrol info"),
+        FieldSpec(classname="bw-rainfall", name="Rainfall"),
+        FieldSpec(classname="bw-high-tide", name="High tide"),
+        FieldSpec(classname="bw-low-tide", name="Low tide"),
+        FieldSpec(classname="bw-alert-text", name="Alert", tags=("div",), multi=True),
+    ],
+)
+
+BEACHMAPP_BASE_URL = BEACHMAPP_SPEC.base_url
+BEACHWATCH_FIELDS = BEACHMAPP_SPEC.field_names()
+
+# The sites scraped by the scrape_sites flow (see scrape_engine)
+SITE_SPECS = [BEACHMAPP_SPEC]